@@ -0,0 +1,473 @@
+"""
+Воспроизводимый бенчмарк операций с клиентами.
+
+Генерирует синтетические наборы клиентов заданных размеров, загружает их в хранилище и измеряет
+пропускную способность и задержки p50/p95/p99 каждой операции при разном числе параллельных потоков.
+Результат записывается в JSON, который можно сравнить с результатом другого коммита (--baseline).
+
+    python benchmark.py --backend memory --sizes 10000
+    python benchmark.py --backend postgres --ephemeral --sizes 10000 1000000 --output results.json
+    python benchmark.py --backend postgres --database bench --baseline results.json
+
+Внимание: с --backend postgres бенчмарк пересоздает таблицы (create_database) в указанной базе.
+"""
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import count, islice
+import json
+import math
+import os
+import platform
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import homework
+from memory_backend import MemoryBackend
+from metrics import Instrumentation
+from queries import ClientRecord
+
+# MemoryBackend держит весь набор в памяти процесса (около 0,9 КБ на клиента), поэтому
+# 10 млн клиентов для него (около 9 ГБ) задаются только явно через --sizes
+DEFAULT_SIZES = {'memory': (10_000, 1_000_000), 'postgres': (10_000, 1_000_000, 10_000_000)}
+DEFAULT_CONCURRENCY = (1, 4, 16)
+
+# Доля клиентов с 0, 1, 2, 3 и 4 телефонами
+PHONES_DISTRIBUTION = (0.15, 0.55, 0.2, 0.07, 0.03)
+
+FIRST_NAMES = (
+    'Александр', 'Алексей', 'Анастасия', 'Андрей', 'Анна', 'Артем', 'Виктория', 'Владимир', 'Дарья', 'Дмитрий',
+    'Евгений', 'Екатерина', 'Елена', 'Иван', 'Игорь', 'Ирина', 'Кирилл', 'Ксения', 'Максим', 'Мария',
+    'Марина', 'Матвей', 'Михаил', 'Наталья', 'Никита', 'Николай', 'Ольга', 'Павел', 'Полина', 'Роман',
+    'Светлана', 'Сергей', 'София', 'Татьяна', 'Тимофей', 'Юлия', 'Юрий', 'Яна', 'Ярослав', 'Григорий',
+)
+LAST_NAME_ROOTS = (
+    'Смирн', 'Иван', 'Кузнец', 'Попов', 'Соколь', 'Лебед', 'Козл', 'Новик', 'Мороз', 'Петр',
+    'Волк', 'Соловь', 'Василь', 'Зайц', 'Павл', 'Семен', 'Голуб', 'Виноград', 'Богдан', 'Воробь',
+    'Федор', 'Михайл', 'Беляк', 'Тарас', 'Белоус', 'Комар', 'Орл', 'Кисел', 'Макар', 'Андре',
+    'Ковал', 'Ильин', 'Гусев', 'Титов', 'Кузьмин', 'Кудрявц', 'Баран', 'Кулик', 'Алексе', 'Степан',
+    'Яковл', 'Сорок', 'Сергеен', 'Роман', 'Захар', 'Борисен', 'Корол', 'Герасим', 'Пономар', 'Григорь',
+)
+LAST_NAME_ENDINGS = ('ов', 'ев', 'ин', 'ский', 'енко', 'ович', 'ук', 'ых', 'ан', 'як')
+EMAIL_DOMAINS = ('mail.ru', 'yandex.ru', 'gmail.com', 'bk.ru', 'inbox.ru')
+
+# Критерии find_client и поля клиента, из которых берутся значения условий
+FIND_CRITERIA = {
+    'FirstName': ('FirstName',),
+    'LastName': ('LastName',),
+    'FirstName+LastName': ('FirstName', 'LastName'),
+    'Email': ('Email',),
+    'PhoneNumber': ('PhoneNumber',),
+}
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(value: int) -> int:
+    # splitmix64: равномерные псевдослучайные биты из номера клиента без общего состояния
+    value = (value + 0x9E3779B97F4A7C15) & _MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK
+    return value ^ (value >> 31)
+
+
+def make_client(ClientID: int, seed: int = 0) -> ClientRecord:
+    """
+    Синтетический клиент с номером ClientID. Один и тот же (ClientID, seed) всегда дает одного
+    и того же клиента, поэтому нагрузку можно строить, не храня весь набор данных.
+    """
+    bits = _mix((seed << 40) + ClientID)
+    FirstName = FIRST_NAMES[bits % len(FIRST_NAMES)]
+    LastName = (LAST_NAME_ROOTS[(bits >> 8) % len(LAST_NAME_ROOTS)]
+                + LAST_NAME_ENDINGS[(bits >> 16) % len(LAST_NAME_ENDINGS)])
+    Email = f'user{ClientID}@{EMAIL_DOMAINS[(bits >> 24) % len(EMAIL_DOMAINS)]}'
+    share, phones = ((bits >> 32) % 1000) / 1000, 0
+    while phones < len(PHONES_DISTRIBUTION) - 1 and share >= PHONES_DISTRIBUTION[phones]:
+        share -= PHONES_DISTRIBUTION[phones]
+        phones += 1
+    PhoneNumbers = tuple(f'+7{9_000_000_000 + ClientID * 5 + number}' for number in range(phones))
+    return ClientRecord(ClientID, FirstName, LastName, Email, PhoneNumbers)
+
+
+def generate_clients(size: int, seed: int = 0):
+    """
+    :return: Генератор клиентов с ClientID от 1 до size.
+    """
+    return (make_client(ClientID, seed) for ClientID in range(1, size + 1))
+
+
+class _LinesFile:
+    """
+    Файловый объект для COPY ... FROM STDIN поверх генератора строк: данные не собираются в памяти.
+    """
+
+    def __init__(self, lines) -> None:
+        self._lines = lines
+
+    def read(self, size: int = -1) -> str:
+        return ''.join(islice(self._lines, 10000))
+
+    readline = read
+
+
+def load_dataset(repo, size: int, seed: int = 0) -> float:
+    """
+    Пересоздает хранилище и загружает в него size синтетических клиентов.
+    В PostgreSQL данные идут через COPY с теми же ClientID, что и в make_client.
+
+    :return: Время загрузки в секундах.
+    """
+    started = time.perf_counter()
+    repo.create_database()
+    if isinstance(repo, MemoryBackend):
+        repo.load_snapshot(generate_clients(size, seed))
+        return time.perf_counter() - started
+
+    with repo.pool.transaction() as conn:
+        with conn.cursor() as cur:
+            cur.copy_expert('COPY Clients (ClientID, FirstName, LastName, Email) FROM STDIN', _LinesFile(
+                f'{c.ClientID}\t{c.FirstName}\t{c.LastName}\t{c.Email}\n' for c in generate_clients(size, seed)))
+            cur.copy_expert('COPY ClientPhones (ClientID, PhoneNumber) FROM STDIN', _LinesFile(
+                f'{c.ClientID}\t{PhoneNumber}\n' for c in generate_clients(size, seed) for PhoneNumber in c.PhoneNumbers))
+            cur.execute("SELECT setval(pg_get_serial_sequence('clients', 'clientid'), %s)", (size,))
+    # ANALYZE вне транзакции загрузки, чтобы планировщик видел реальные размеры таблиц
+    with repo.pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('ANALYZE Clients, ClientPhones')
+    return time.perf_counter() - started
+
+
+def build_workload(size: int, seed: int, iterations: int, levels: int) -> list:
+    """
+    Готовит аргументы всех вызовов заранее, чтобы генерация не попадала в замеры.
+    Изменяющие операции получают непересекающиеся наборы клиентов на каждый уровень параллельности:
+    номер, который уже удален или изменен, не может быть целью следующей операции.
+
+    :return: Список (operation, criterion, [список аргументов на каждый уровень]).
+    """
+    rnd = random.Random(seed)
+    with_phones = []
+    others = []
+    for ClientID in rnd.sample(range(1, size + 1), min(size, iterations * levels * 4)):
+        (with_phones if make_client(ClientID, seed).PhoneNumbers else others).append(ClientID)
+    needed = iterations * levels * 2
+    if len(with_phones) < needed:
+        raise ValueError(f'Для {iterations} итераций на {levels} уровнях нужно не меньше {needed} клиентов '
+                         f'с телефонами, в наборе из {size} клиентов их {len(with_phones)}; уменьшите --iterations')
+
+    def targets(pool: list) -> list:
+        # Следующие iterations * levels клиентов из пула, по iterations на уровень
+        chunk, pool[:] = pool[:iterations * levels], pool[iterations * levels:]
+        return [chunk[level * iterations:(level + 1) * iterations] for level in range(levels)]
+
+    # update_* и delete_client (он идет последним) меняют одних клиентов, delete_clientphone - других:
+    # иначе удалялся бы номер, который update_phonenumber уже заменил
+    changed, delete_phones = targets(with_phones), targets(with_phones)
+    # Чтение и добавление телефонов - по остальным клиентам, в том числе без телефонов
+    readable = with_phones + others
+    reads = [[rnd.choice(readable) for _ in range(iterations)] for _ in range(levels)]
+    new_ids = count(size + 1)
+    new_numbers = count()
+
+    def new_client() -> tuple:
+        client = make_client(next(new_ids), seed)
+        return client.FirstName, client.LastName, client.Email, new_phone()
+
+    def new_phone() -> str:
+        return f'+78{next(new_numbers):09d}'
+
+    workload = [
+        ('add_client', None, [[new_client() for _ in range(iterations)] for _ in range(levels)]),
+        ('add_phonenumber', None, [[(ClientID, new_phone()) for ClientID in level] for level in reads]),
+        ('update_client_data', None, [[(ClientID, None, make_client(ClientID, seed + 1).LastName, None)
+                                       for ClientID in level] for level in changed]),
+        ('update_phonenumber', None, [[(ClientID, make_client(ClientID, seed).PhoneNumbers[0], new_phone())
+                                       for ClientID in level] for level in changed]),
+    ]
+    for criterion, fields in FIND_CRITERIA.items():
+        levels_args = []
+        for level in reads:
+            args = []
+            for ClientID in level:
+                client = make_client(ClientID, seed)
+                values = {field: getattr(client, field) for field in ('FirstName', 'LastName', 'Email')}
+                values['PhoneNumber'] = client.PhoneNumbers[-1] if client.PhoneNumbers else new_phone()
+                args.append(tuple(values.get(name) if name in fields else None
+                                  for name in ('FirstName', 'LastName', 'Email', 'PhoneNumber')))
+            levels_args.append(args)
+        workload.append(('find_client', criterion, levels_args))
+    workload += [
+        ('delete_clientphone', None, [[(ClientID, make_client(ClientID, seed).PhoneNumbers[-1])
+                                       for ClientID in level] for level in delete_phones]),
+        ('delete_client', None, [[(ClientID,) for ClientID in level] for level in changed]),
+    ]
+    return workload
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга по отсортированному списку.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(math.ceil(q * len(values)) - 1, 0))]
+
+
+def run_operation(method, calls: list, concurrency: int) -> dict:
+    """
+    Выполняет вызовы method(*args) в concurrency потоках и измеряет задержку каждого.
+
+    :return: Пропускная способность, задержки в миллисекундах и ошибки по классам исключений.
+    """
+    latencies = [0.0] * len(calls)
+
+    def worker(offset: int) -> Counter:
+        errors = Counter()
+        for index in range(offset, len(calls), concurrency):
+            started = time.perf_counter()
+            try:
+                method(*calls[index])
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            latencies[index] = time.perf_counter() - started
+        return errors
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        started = time.perf_counter()
+        errors = sum(executor.map(worker, range(concurrency)), Counter())
+        seconds = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'iterations': len(calls),
+        'seconds': seconds,
+        'throughput': len(calls) / seconds if seconds else 0.0,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        'errors': dict(errors),
+    }
+
+
+def run_benchmark(repo, sizes: tuple, concurrency: tuple, iterations: int, seed: int = 0,
+                  warmup: int = 100, log=None) -> dict:
+    """
+    Для каждого размера набора данных загружает его заново и прогоняет все операции на всех уровнях параллельности.
+
+    :param repo: Хранилище (StorageBackend) с instrumentation для подсчета запросов.
+    :param log: Функция для вывода хода выполнения (например, print в stderr).
+    :return: {'datasets': [...], 'results': [...]} для JSON.
+    """
+    log = log or (lambda message: None)
+    datasets, results = [], []
+    for size in sizes:
+        log(f'Загрузка {size} клиентов...')
+        load_seconds = load_dataset(repo, size, seed)
+        datasets.append({'size': size, 'load_seconds': load_seconds})
+        log(f'Загружено за {load_seconds:.1f} с')
+        workload = build_workload(size, seed, iterations, len(concurrency))
+
+        # Прогрев кэшей базы и интерпретатора чтением, которое не меняет данные
+        for _, criterion, levels_args in workload:
+            if criterion is not None:
+                for args in levels_args[0][:warmup]:
+                    repo.find_client(*args)
+
+        for level, threads in enumerate(concurrency):
+            for operation, criterion, levels_args in workload:
+                repo.instrumentation.reset()
+                result = {'size': size, 'operation': operation, 'criterion': criterion, 'concurrency': threads}
+                result.update(run_operation(getattr(repo, operation), levels_args[level], threads))
+                stats = repo.instrumentation.snapshot().get(operation, {})
+                calls = stats.get('calls') or 1
+                result.update(queries_per_call=stats.get('queries', 0) / calls,
+                              round_trips_per_call=stats.get('round_trips', 0) / calls,
+                              rows_per_call=stats.get('rows', 0) / calls)
+                results.append(result)
+                name = operation if criterion is None else f'{operation}[{criterion}]'
+                log(f'{size:>9} x{threads:<3} {name:<32} {result["throughput"]:>10.0f} оп/с  '
+                    f'p50 {result["p50_ms"]:.3f}  p95 {result["p95_ms"]:.3f}  p99 {result["p99_ms"]:.3f} мс')
+    return {'datasets': datasets, 'results': results}
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """
+    Сравнивает результаты с результатами другого запуска по (size, operation, criterion, concurrency).
+
+    :param threshold: Допустимое ухудшение: 0.2 - p95 вырос или пропускная способность упала больше чем на 20%.
+    :return: Список строк с описанием регрессий.
+    """
+    def key(result: dict) -> tuple:
+        return result['size'], result['operation'], result['criterion'], result['concurrency']
+
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        name = result['operation'] if result['criterion'] is None else f'{result["operation"]}[{result["criterion"]}]'
+        if old['p95_ms'] and result['p95_ms'] > old['p95_ms'] * (1 + threshold):
+            regressions.append(f'{result["size"]} x{result["concurrency"]} {name}: '
+                               f'p95 {old["p95_ms"]:.3f} -> {result["p95_ms"]:.3f} мс')
+        if result['throughput'] < old['throughput'] * (1 - threshold):
+            regressions.append(f'{result["size"]} x{result["concurrency"]} {name}: '
+                               f'{old["throughput"]:.0f} -> {result["throughput"]:.0f} оп/с')
+    return regressions
+
+
+class EphemeralPostgres:
+    """
+    Временный кластер PostgreSQL: initdb в новом каталоге, запуск через pg_ctl, после работы -
+    остановка и удаление каталога. Сервер слушает только unix-сокет в этом же каталоге.
+    initdb не запускается от root, поэтому бенчмарк с --ephemeral запускают от обычного пользователя.
+    """
+
+    def __init__(self, bin_dir: str = None) -> None:
+        """
+        :param bin_dir: Каталог с initdb и pg_ctl; по умолчанию ищутся в PATH.
+        """
+        self.bin_dir = bin_dir
+        self.directory = None
+
+    def _binary(self, name: str) -> str:
+        path = os.path.join(self.bin_dir, name) if self.bin_dir else shutil.which(name)
+        if not path or not os.path.exists(path):
+            raise FileNotFoundError(f'Не найден {name}: укажите каталог с программами PostgreSQL в --pg-bin')
+        return path
+
+    def __enter__(self) -> dict:
+        """
+        :return: Параметры соединения для ClientRepository.
+        """
+        if hasattr(os, 'geteuid') and os.geteuid() == 0:
+            raise RuntimeError('initdb нельзя запускать от root: запустите бенчмарк от обычного пользователя')
+        self.directory = tempfile.mkdtemp(prefix='clients-bench-')
+        data = os.path.join(self.directory, 'data')
+        options = f"-c listen_addresses='' -k {shlex.quote(self.directory)} -p 5432"
+        try:
+            for command in ([self._binary('initdb'), '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8',
+                             '--locale=C'],
+                            [self._binary('pg_ctl'), '-D', data, '-l', os.path.join(self.directory, 'server.log'),
+                             '-o', options, '-w', 'start']):
+                process = subprocess.run(command, capture_output=True, text=True)
+                if process.returncode:
+                    raise RuntimeError(f'{os.path.basename(command[0])} завершился с кодом {process.returncode}: '
+                                       f'{process.stderr.strip()}')
+        except BaseException:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            raise
+        return {'host': self.directory, 'port': 5432, 'user': 'postgres', 'database': 'postgres'}
+
+    def __exit__(self, *exc_info) -> None:
+        subprocess.run([self._binary('pg_ctl'), '-D', os.path.join(self.directory, 'data'), '-m', 'fast', '-w', 'stop'],
+                       capture_output=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Бенчмарк операций с клиентами')
+    parser.add_argument('--backend', choices=('memory', 'postgres'), default='memory')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help='Размеры наборов данных (количество клиентов); по умолчанию 10 тыс. и 1 млн '
+                             'для memory и еще 10 млн для postgres')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=DEFAULT_CONCURRENCY,
+                        help='Количество параллельных потоков')
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='Количество вызовов каждой операции на каждом уровне параллельности')
+    parser.add_argument('--warmup', type=int, default=100, help='Количество прогревочных вызовов find_client')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно генератора данных и нагрузки')
+    parser.add_argument('--output', help='Файл для результатов в JSON; по умолчанию - стандартный вывод')
+    parser.add_argument('--baseline', help='JSON с результатами предыдущего запуска для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Допустимое ухудшение p95 и пропускной способности относительно --baseline')
+    postgres = parser.add_argument_group('PostgreSQL')
+    postgres.add_argument('--ephemeral', action='store_true',
+                          help='Запустить временный сервер PostgreSQL (initdb и pg_ctl)')
+    postgres.add_argument('--pg-bin', help='Каталог с initdb и pg_ctl для --ephemeral')
+    postgres.add_argument('--database', help='База данных; ее таблицы будут пересозданы')
+    postgres.add_argument('--user', default=homework.user)
+    postgres.add_argument('--password', default=homework.password)
+    postgres.add_argument('--host')
+    postgres.add_argument('--port', type=int)
+    args = parser.parse_args(argv)
+    if args.backend == 'postgres' and not args.ephemeral and not args.database:
+        parser.error('для --backend postgres укажите --database или --ephemeral')
+    if args.sizes is None:
+        args.sizes = DEFAULT_SIZES[args.backend]
+    return args
+
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv)
+
+    def log(message: str) -> None:
+        print(message, file=sys.stderr, flush=True)
+
+    meta = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'commit': _commit(),
+        'backend': args.backend,
+        'sizes': args.sizes,
+        'concurrency': args.concurrency,
+        'iterations': args.iterations,
+        'seed': args.seed,
+        'phones_distribution': PHONES_DISTRIBUTION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    instrumentation = Instrumentation()
+    if args.backend == 'memory':
+        with MemoryBackend(instrumentation=instrumentation) as repo:
+            report = run_benchmark(repo, args.sizes, args.concurrency, args.iterations, args.seed, args.warmup, log)
+    else:
+        server = EphemeralPostgres(args.pg_bin) if args.ephemeral else None
+        params = server.__enter__() if server else {
+            key: value for key, value in (('database', args.database), ('user', args.user),
+                                          ('password', args.password), ('host', args.host), ('port', args.port))
+            if value is not None}
+        try:
+            with homework.ClientRepository(instrumentation=instrumentation, max_size=max(args.concurrency),
+                                           **params) as repo:
+                with repo.pool.connection() as conn:
+                    meta['postgres'] = conn.server_version
+                report = run_benchmark(repo, args.sizes, args.concurrency, args.iterations, args.seed,
+                                       args.warmup, log)
+        finally:
+            if server:
+                server.__exit__(None, None, None)
+
+    output = json.dumps(dict(meta=meta, **report), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(report['results'], json.load(file)['results'], args.threshold)
+        for regression in regressions:
+            log(f'Регрессия: {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
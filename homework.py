@@ -1,12 +1,941 @@
 import psycopg2
+import psycopg2.errors
+import psycopg2.extras
+from psycopg2.pool import PoolError
 from dotenv import load_dotenv
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from itertools import islice
 import os
+import threading
+import time
+
+import metrics
+import queries
+from metrics import Instrumentation
+from queries import ClientRecord
+from storage import (ON_CONFLICT_POLICIES, BulkLoadReport, ExportReport, ExportWriter, OperationResult,
+                     StorageBackend, read_client_records, split_client_record)
 
 # Загрузка переменных окружения
 load_dotenv()
 database = os.getenv("database")
 user = os.getenv("user")
 password = os.getenv("password")
+pool_min_size = int(os.getenv("pool_min_size", 1))
+pool_max_size = int(os.getenv("pool_max_size", 10))
+cache_size = int(os.getenv("cache_size", 0))
+cache_ttl = float(os.getenv("cache_ttl", 60))
+metrics_enabled = os.getenv("metrics_enabled", "0") == "1"
+slow_query_ms = os.getenv("slow_query_ms")
+
+
+class ConnectionPool:
+    """
+    Ограниченный потокобезопасный пул соединений с PostgreSQL.
+
+    При создании открывается min_size соединений, одновременно выдается не более max_size.
+    Перед выдачей соединение проверяется: закрытое соединение заменяется новым,
+    а простоявшее без дела дольше check_interval секунд проверяется запросом SELECT 1.
+    Соединения работают в режиме autocommit: одиночный запрос не требует отдельных BEGIN и COMMIT.
+    Несколько запросов в одной транзакции выполняются через transaction().
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 10, timeout: float = 30.0,
+                 check_interval: float = 30.0, **conn_params) -> None:
+        """
+        :param min_size: Количество соединений, открываемых сразу.
+        :param max_size: Максимальное количество одновременно открытых соединений.
+        :param timeout: Сколько секунд ждать свободное соединение, прежде чем выбросить PoolError.
+        :param check_interval: Через сколько секунд простоя соединение проверяется перед выдачей.
+        :param conn_params: Параметры для psycopg2.connect().
+        """
+        if max_size < 1 or not 0 <= min_size <= max_size:
+            raise ValueError('Должно выполняться 0 <= min_size <= max_size и max_size >= 1')
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._conn_params = conn_params
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._conn_params)
+        conn.autocommit = True
+        return conn
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """
+        Выдает соединение из пула, при необходимости открывая новое.
+        Если все max_size соединений заняты, ждет освобождения не дольше timeout секунд.
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError('Пул соединений закрыт')
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    conn, last_used = None, None
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError('Нет свободных соединений в пуле')
+                self._cond.wait(remaining)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                conn.close()
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, close: bool = False) -> None:
+        """
+        Возвращает соединение в пул. Незавершенная транзакция откатывается.
+
+        :param conn: Соединение, полученное через getconn().
+        :param close: Закрыть соединение вместо возврата в пул.
+        """
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self._cond:
+            if close or conn.closed or self._closed:
+                if not conn.closed:
+                    conn.close()
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _getconn_measured(self, call: metrics.Call):
+        if call is None:
+            return self.getconn()
+        started = time.perf_counter()
+        conn = self.getconn()
+        call.connect_seconds += time.perf_counter() - started
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Выдает соединение в режиме autocommit на время блока with:
+        каждый запрос фиксируется сразу, за одно обращение к серверу.
+        """
+        conn = self._getconn_measured(metrics.current_call())
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Выдает соединение на время блока with, в котором все запросы выполняются одной транзакцией.
+        При успешном выходе транзакция фиксируется, при исключении откатывается.
+        """
+        call = metrics.current_call()
+        conn = self._getconn_measured(call)
+        try:
+            conn.autocommit = False
+            yield conn
+            if call is None:
+                conn.commit()
+            else:
+                started = time.perf_counter()
+                conn.commit()
+                call.add_round_trip(time.perf_counter() - started)
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            try:
+                if not conn.closed:
+                    conn.autocommit = True
+            except psycopg2.Error:
+                conn.close()
+            self.putconn(conn)
+
+    def close(self) -> None:
+        """
+        Закрывает пул: свободные соединения закрываются сразу, занятые - при возврате.
+        """
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+                self._size -= 1
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ClientCache:
+    """
+    Потокобезопасный LRU-кэш клиентов с ограниченным временем жизни записей.
+
+    Запись хранится один раз на ClientID, а искать ее можно по ClientID, Email (без учета регистра)
+    и любому из номеров телефона. Записи старше ttl секунд не выдаются.
+    Email уникален с учетом регистра, поэтому клиент доступен по Email, только если при чтении
+    он был единственным с таким Email без учета регистра (см. ClientRepository._get_clients).
+    Счетчик evictions учитывает записи, вытесненные как по размеру, так и по ttl.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0) -> None:
+        """
+        :param maxsize: Максимальное количество клиентов в кэше.
+        :param ttl: Сколько секунд запись считается актуальной.
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize должен быть положительным')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._records = OrderedDict()
+        self._aliases = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(record: ClientRecord, kinds: tuple = ('Email', 'PhoneNumber')) -> list:
+        keys = [('Email', record.Email.lower())] if 'Email' in kinds else []
+        if 'PhoneNumber' in kinds:
+            keys.extend(('PhoneNumber', phone) for phone in record.PhoneNumbers)
+        return keys
+
+    def _remove(self, ClientID: int) -> None:
+        expires, record = self._records.pop(ClientID)
+        for key in self._keys(record):
+            if self._aliases.get(key) == ClientID:
+                del self._aliases[key]
+
+    def token(self) -> int:
+        """
+        Возвращает метку, которую нужно получить до чтения из базы и передать в put().
+        Если между token() и put() кэш инвалидировался, прочитанная запись могла устареть и не сохраняется.
+        """
+        with self._lock:
+            return self._generation
+
+    def get(self, key: tuple) -> ClientRecord:
+        """
+        :param key: ('ClientID', id), ('Email', email) или ('PhoneNumber', номер).
+        :return: ClientRecord или None, если записи нет или она устарела.
+        """
+        kind, value = key
+        if kind == 'Email':
+            value = value.lower()
+        with self._lock:
+            ClientID = value if kind == 'ClientID' else self._aliases.get((kind, value))
+            entry = self._records.get(ClientID)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(ClientID)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._records.move_to_end(ClientID)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, record: ClientRecord, token: int, kinds: tuple = ('PhoneNumber',)) -> None:
+        """
+        Сохраняет клиента, если с момента получения token кэш не инвалидировался.
+
+        :param record: Прочитанный из базы клиент.
+        :param token: Метка, полученная через token() до чтения.
+        :param kinds: По каким ключам, кроме ClientID, искать клиента: 'PhoneNumber' и 'Email'.
+                      'Email' передается, только если клиент прочитан поиском по Email
+                      и оказался единственным с таким Email без учета регистра.
+        """
+        with self._lock:
+            if token != self._generation:
+                return
+            if record.ClientID in self._records:
+                self._remove(record.ClientID)
+            self._records[record.ClientID] = (time.monotonic() + self.ttl, record)
+            for key in self._keys(record, kinds):
+                self._aliases[key] = record.ClientID
+            while len(self._records) > self.maxsize:
+                self._remove(next(iter(self._records)))
+                self.evictions += 1
+
+    def invalidate(self, *ClientIDs: int, Emails=()) -> None:
+        """
+        Удаляет из кэша указанных клиентов вместе со всеми их Email и номерами.
+
+        :param Emails: Email, которые появились у других клиентов: клиенты с такими же Email
+                       без учета регистра тоже удаляются, так как поиск по Email вернет уже не только их.
+        """
+        with self._lock:
+            self._generation += 1
+            ClientIDs = set(ClientIDs)
+            ClientIDs.update(self._aliases.get(('Email', Email.lower())) for Email in Emails)
+            for ClientID in ClientIDs:
+                if ClientID in self._records:
+                    self._remove(ClientID)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._records.clear()
+            self._aliases.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._records)}
+
+
+class _BatchSpec(namedtuple('_BatchSpec', 'sql template params conflict_keys arg_key row_key data')):
+    """
+    Как выполнить группу одинаковых операций одним запросом:
+    params - строка VALUES для операции, conflict_keys - ключи, повтор которых внутри группы
+    требует отдельного запроса, arg_key и row_key - сопоставление операции со строкой RETURNING,
+    data - данные результата из строки RETURNING.
+    """
+    __slots__ = ()
+
+
+_BATCH_SPECS = {
+    'add_client': _BatchSpec(
+        queries.BATCH_ADD_CLIENTS, queries.BATCH_ADD_CLIENTS_TEMPLATE,
+        lambda args: args[:3] + (args[3] or None,),
+        lambda args: (),
+        lambda args: args[2],
+        lambda row: row[3],
+        tuple),
+    'add_phonenumber': _BatchSpec(
+        queries.BATCH_ADD_PHONES, queries.BATCH_ADD_PHONES_TEMPLATE,
+        lambda args: args,
+        lambda args: (),
+        lambda args: (args[0], args[1]),
+        lambda row: (row[0], row[1]),
+        lambda row: tuple(row[2:])),
+    'update_client_data': _BatchSpec(
+        queries.BATCH_UPDATE_CLIENTS, queries.BATCH_UPDATE_CLIENTS_TEMPLATE,
+        lambda args: args,
+        # UNIQUE (Email) проверяется построчно, поэтому два обмена Email в одном запросе могут
+        # столкнуться, хотя по очереди выполнились бы: смена Email всегда начинает новый запрос
+        lambda args: (args[0],) if args[3] is None else (args[0], 'Email'),
+        lambda args: args[0],
+        lambda row: row[0],
+        lambda row: tuple(row[1:])),
+    'update_phonenumber': _BatchSpec(
+        queries.BATCH_UPDATE_PHONES, queries.BATCH_UPDATE_PHONES_TEMPLATE,
+        lambda args: args,
+        lambda args: (args[1], args[2]),
+        lambda args: (args[0], args[1]),
+        lambda row: (row[0], row[1]),
+        lambda row: None),
+    'delete_clientphone': _BatchSpec(
+        queries.BATCH_DELETE_PHONES, queries.BATCH_DELETE_PHONES_TEMPLATE,
+        lambda args: args,
+        lambda args: (args[1],),
+        lambda args: (args[0], args[1]),
+        lambda row: (row[0], row[1]),
+        lambda row: None),
+    'delete_client': _BatchSpec(
+        queries.BATCH_DELETE_CLIENTS, queries.BATCH_DELETE_CLIENTS_TEMPLATE,
+        lambda args: args,
+        lambda args: (args[0],),
+        lambda args: args[0],
+        lambda row: row[0],
+        lambda row: None),
+}
+
+
+def _group_operations(operations: list):
+    """
+    Делит операции на группы подряд идущих одинаковых операций, которые можно выполнить
+    одним запросом. Группа прерывается, если операция затрагивает ключ, уже измененный
+    в этой группе: внутри одного запроса она не увидела бы результат предыдущей.
+    """
+    group, seen = [], set()
+    for operation, args in operations:
+        keys = _BATCH_SPECS[operation].conflict_keys(args)
+        if group and (group[0][0] != operation or seen.intersection(keys)):
+            yield group[0][0], group
+            group, seen = [], set()
+        group.append((operation, args))
+        seen.update(keys)
+    if group:
+        yield group[0][0], group
+
+
+class ClientRepository(StorageBackend):
+    """
+    Реализация StorageBackend поверх PostgreSQL (хранилище по умолчанию).
+    Операции над таблицами Clients и ClientPhones через общий пул соединений.
+    В отличие от функций модуля, методы ничего не печатают: они возвращают данные
+    и пробрасывают исключения вызывающему коду.
+    """
+
+    def __init__(self, pool: ConnectionPool = None, cache: ClientCache = None,
+                 instrumentation: Instrumentation = None, **pool_params) -> None:
+        """
+        :param pool: Готовый пул соединений.
+        :param cache: Кэш для get_client, get_client_by_email, get_client_by_phone
+                      и find_client только по Email или только по PhoneNumber.
+                      Без него эти методы всегда обращаются к базе.
+        :param instrumentation: Сбор метрик операций. Чтобы учитывались запросы,
+                                соединения готового пула должны создаваться с cursor_factory=metrics.InstrumentedCursor.
+        :param pool_params: Параметры для создания нового ConnectionPool, если pool не передан.
+        """
+        if pool is None:
+            if instrumentation is not None:
+                pool_params.setdefault('cursor_factory', metrics.InstrumentedCursor)
+            pool = ConnectionPool(**pool_params)
+        self.pool = pool
+        self.cache = cache
+        self.instrumentation = instrumentation
+
+    def _invalidate(self, *ClientIDs: int, Emails=()) -> None:
+        # Вызывается после фиксации транзакции, иначе параллельное чтение
+        # успело бы снова положить в кэш старые данные
+        if self.cache is not None:
+            self.cache.invalidate(*ClientIDs, Emails=Emails)
+
+    def close(self) -> None:
+        self.pool.close()
+
+    @metrics.instrumented
+    def create_database(self) -> None:
+        """
+        Создает таблицы Clients и ClientPhones, если они не существуют.
+        Удаляет таблицы, если они уже существуют.
+        """
+        with self.pool.transaction() as conn:
+            with conn.cursor() as cur:
+                for sql in queries.CREATE_DATABASE:
+                    cur.execute(sql)
+                cur.execute('SAVEPOINT trigram_indexes')
+                try:
+                    cur.execute(queries.CREATE_TRIGRAM_INDEXES)
+                except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.UndefinedFile,
+                        psycopg2.errors.InsufficientPrivilege):
+                    # Без pg_trgm поиск по подстроке номера работает полным просмотром, а нечеткий поиск недоступен
+                    cur.execute('ROLLBACK TO SAVEPOINT trigram_indexes')
+        if self.cache is not None:
+            self.cache.clear()
+
+    @metrics.instrumented
+    def add_client(self, FirstName: str, LastName: str, Email: str, PhoneNumber: str = None) -> tuple:
+        """
+        Добавляет нового клиента в таблицу Clients.
+        Если указан номер телефона, добавляет его в таблицу ClientPhones.
+
+        :return: (ClientID, FirstName, LastName, Email, PhoneNumber) добавленного клиента.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(queries.ADD_CLIENT, (FirstName, LastName, Email, PhoneNumber or None))
+                client = cur.fetchone()
+        self._invalidate(Emails=(Email,))
+        return client
+
+    @metrics.instrumented
+    def add_phonenumber(self, ClientID: int, PhoneNumber: str) -> tuple:
+        """
+        Добавляет номер телефона клиента в таблицу ClientPhones.
+
+        :return: (FirstName, LastName, Email) клиента.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(queries.ADD_PHONE, (ClientID, PhoneNumber))
+                client = cur.fetchone()
+        self._invalidate(ClientID)
+        return client
+
+    @metrics.instrumented
+    def update_client_data(self, ClientID: int, FirstName: str = None, LastName: str = None,
+                           Email: str = None) -> tuple:
+        """
+        Обновляет данные клиента в таблице Clients.
+
+        :return: (FirstName, LastName, Email) после изменения или None, если клиента не существует.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(queries.UPDATE_CLIENT, (FirstName, LastName, Email, ClientID))
+                client = cur.fetchone()
+        self._invalidate(ClientID, Emails=(Email,) if Email is not None else ())
+        return client
+
+    @metrics.instrumented
+    def update_phonenumber(self, ClientID: int, old_phone: str = None, new_phone: str = None) -> bool:
+        """
+        Обновляет номер телефона клиента в таблице ClientPhones.
+
+        :return: True, если у клиента был номер old_phone и он изменен.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(queries.UPDATE_PHONE, (new_phone, ClientID, old_phone))
+                phone = cur.fetchone()
+        self._invalidate(ClientID)
+        return bool(phone)
+
+    @metrics.instrumented
+    def delete_clientphone(self, ClientID: int, PhoneNumber: str) -> bool:
+        """
+        Удаляет номер телефона клиента из таблицы ClientPhones.
+
+        :return: True, если номер был найден и удален.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(queries.DELETE_PHONE, (ClientID, PhoneNumber))
+                PhoneID = cur.fetchone()
+        self._invalidate(ClientID)
+        return bool(PhoneID)
+
+    @metrics.instrumented
+    def delete_client(self, ClientID: int) -> bool:
+        """
+        Удаляет данные клиента из таблицы Clients и все его номера телефонов из таблицы ClientPhones.
+
+        :return: True, если клиент существовал.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(queries.DELETE_CLIENT, (ClientID, ClientID))
+                client = cur.fetchone()
+        self._invalidate(ClientID)
+        return bool(client)
+
+    def _fetch_clients(self, kind: str, value) -> list:
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(queries.find_client_query((kind,)), (value,))
+                return [ClientRecord.from_row(row) for row in cur.fetchall()]
+
+    def _get_clients(self, kind: str, value) -> list:
+        """
+        Ищет клиентов по ClientID, Email или PhoneNumber сначала в кэше, затем в базе.
+        Кэшируется только однозначный результат: несколько клиентов с одинаковым
+        без учета регистра Email всегда читаются из базы.
+        """
+        if self.cache is None:
+            return self._fetch_clients(kind, value)
+        client = self.cache.get((kind, value))
+        if client is not None:
+            return [client]
+        token = self.cache.token()
+        clients = self._fetch_clients(kind, value)
+        if len(clients) == 1:
+            # По ClientID и номеру телефона нельзя узнать, нет ли других клиентов с тем же Email
+            self.cache.put(clients[0], token, ('Email', 'PhoneNumber') if kind == 'Email' else ('PhoneNumber',))
+        return clients
+
+    def _get_client(self, kind: str, value) -> ClientRecord:
+        clients = self._get_clients(kind, value)
+        return clients[0] if clients else None
+
+    @metrics.instrumented
+    def get_client(self, ClientID: int) -> ClientRecord:
+        """
+        Возвращает клиента по ClientID, используя кэш, если он задан.
+
+        :return: ClientRecord или None, если клиента не существует.
+        """
+        return self._get_client('ClientID', ClientID)
+
+    @metrics.instrumented
+    def get_client_by_email(self, Email: str) -> ClientRecord:
+        """
+        Возвращает клиента по Email (без учета регистра), используя кэш, если он задан.
+
+        :return: ClientRecord или None, если клиента не существует.
+        """
+        return self._get_client('Email', Email)
+
+    @metrics.instrumented
+    def get_client_by_phone(self, PhoneNumber: str) -> ClientRecord:
+        """
+        Возвращает клиента по номеру телефона, используя кэш, если он задан.
+
+        :return: ClientRecord или None, если клиента не существует.
+        """
+        return self._get_client('PhoneNumber', PhoneNumber)
+
+    @metrics.instrumented
+    def iter_clients(self, FirstName: str = None, LastName: str = None, Email: str = None,
+                     PhoneNumber: str = None, after_id: int = None, limit: int = None,
+                     itersize: int = 2000):
+        """
+        Ищет клиентов по заданным параметрам и отдает результат потоково, в порядке ClientID.
+        Строки читаются через серверный курсор порциями по itersize, поэтому первая запись
+        приходит сразу, а расход памяти не зависит от размера выборки.
+        Соединение занято, пока генератор не исчерпан или не закрыт.
+
+        :param FirstName: Имя клиента.
+        :param LastName: Фамилия клиента.
+        :param Email: Email клиента.
+        :param PhoneNumber: Номер телефона клиента.
+        :param after_id: Вернуть только клиентов с ClientID больше указанного (для постраничной выдачи).
+        :param limit: Максимальное количество клиентов.
+        :param itersize: Сколько строк забирать с сервера за один раз.
+        :return: Генератор ClientRecord.
+        """
+        sql, params = queries.find_client_params(FirstName, LastName, Email, PhoneNumber, after_id, limit)
+        with self.pool.transaction() as conn:
+            with conn.cursor(name='iter_clients') as cur:
+                cur.itersize = itersize
+                cur.execute(sql, params)
+                for row in cur:
+                    yield ClientRecord.from_row(row)
+
+    @metrics.instrumented
+    def find_client(self, FirstName: str = None, LastName: str = None, Email: str = None,
+                    PhoneNumber: str = None) -> list:
+        """
+        Ищет клиента в таблице Clients по заданным параметрам.
+        Поиск только по Email или только по PhoneNumber идет через кэш, если он задан.
+
+        :return: Список ClientRecord.
+        """
+        if FirstName is None and LastName is None and (Email is None) != (PhoneNumber is None):
+            return self._get_clients(*(('Email', Email) if Email is not None else ('PhoneNumber', PhoneNumber)))
+        sql, params = queries.find_client_params(FirstName, LastName, Email, PhoneNumber)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return [ClientRecord.from_row(row) for row in cur.fetchall()]
+
+    @metrics.instrumented
+    def search_phones(self, PhoneNumber: str, mode: str = 'prefix', limit: int = 20) -> list:
+        """
+        Ищет клиентов по началу, концу или части номера телефона (см. StorageBackend.search_phones)
+        по индексам на ClientPhones.PhoneDigits.
+
+        :return: Список ClientRecord.
+        """
+        sql, params = queries.search_phones_params(PhoneNumber, mode, limit)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return [ClientRecord.from_row(row) for row in cur.fetchall()]
+
+    @metrics.instrumented
+    def search_clients(self, text: str, mode: str = 'prefix', fields: tuple = queries.SEARCH_FIELDS,
+                       limit: int = 20) -> list:
+        """
+        Ищет клиентов по началу или похожести имени, фамилии и Email (см. StorageBackend.search_clients).
+        Нечеткий поиск требует расширения pg_trgm.
+
+        :return: Список ClientRecord.
+        """
+        sql, params = queries.search_clients_params(text, mode, fields, limit)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return [ClientRecord.from_row(row) for row in cur.fetchall()]
+
+    @metrics.instrumented
+    def execute_batch(self, operations: list, page_size: int = 1000) -> list:
+        """
+        Выполняет операции одной транзакцией (см. StorageBackend.batch()).
+        Подряд идущие одинаковые операции уходят одним запросом на каждые page_size операций.
+
+        :param operations: Список пар (имя метода, кортеж аргументов).
+        :param page_size: Максимальное количество операций в одном запросе.
+        :return: Список OperationResult в порядке операций.
+        """
+        results = []
+        with self.pool.transaction() as conn:
+            with conn.cursor() as cur:
+                for operation, group in _group_operations(operations):
+                    spec = _BATCH_SPECS[operation]
+                    rows = psycopg2.extras.execute_values(
+                        cur, spec.sql, [spec.params(args) for _, args in group],
+                        template=spec.template, page_size=page_size, fetch=True)
+                    found = {spec.row_key(row): row for row in rows}
+                    for _, args in group:
+                        row = found.get(spec.arg_key(args))
+                        results.append(OperationResult(operation, args, row is not None,
+                                                       spec.data(row) if row is not None else None))
+        ClientIDs, Emails = set(), []
+        for result in results:
+            if not result.ok:
+                continue
+            if result.operation == 'add_client':
+                Emails.append(result.args[2])
+                continue
+            ClientIDs.add(result.args[0])
+            if result.operation == 'update_client_data' and result.args[3] is not None:
+                Emails.append(result.args[3])
+        self._invalidate(*ClientIDs, Emails=Emails)
+        return results
+
+    @metrics.instrumented
+    def bulk_load(self, source, batch_size: int = 1000, on_conflict: str = 'skip') -> 'BulkLoadReport':
+        """
+        Загружает клиентов и их телефоны пачками многострочных INSERT.
+        Записи читаются из источника потоково, поэтому расход памяти ограничен размером пачки.
+        Каждая пачка фиксируется отдельной транзакцией.
+
+        :param source: Итерируемый объект с записями (FirstName, LastName, Email, [PhoneNumber, ...])
+                       или путь к файлу .csv / .jsonl (см. read_client_records).
+        :param batch_size: Количество записей в одной пачке.
+        :param on_conflict: Что делать с уже существующими Email и PhoneNumber:
+                            'skip' - пропустить запись, 'upsert' - перезаписать, 'fail' - выбросить исключение.
+        :return: Итоговый отчет о загрузке.
+        """
+        if on_conflict not in ON_CONFLICT_POLICIES:
+            raise ValueError(f'on_conflict должен быть одним из {ON_CONFLICT_POLICIES}')
+        if batch_size < 1:
+            raise ValueError('batch_size должен быть положительным')
+        if isinstance(source, (str, os.PathLike)):
+            source = read_client_records(source)
+
+        records = iter(source)
+        totals = [0, 0, 0, 0, 0]
+        started = time.perf_counter()
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            with self.pool.transaction() as conn:
+                with conn.cursor() as cur:
+                    counts = self._load_batch(cur, batch, on_conflict)
+            # upsert меняет уже существующих клиентов и переносит номера между ними
+            if on_conflict == 'upsert' and self.cache is not None:
+                self.cache.clear()
+            elif self.cache is not None:
+                self.cache.invalidate(Emails=[split_client_record(record)[2] for record in batch])
+            totals = [total + count for total, count in zip(totals, counts)]
+        return BulkLoadReport(*totals, time.perf_counter() - started)
+
+    @staticmethod
+    def _load_batch(cur, batch: list, on_conflict: str) -> tuple:
+        """
+        Вставляет одну пачку записей.
+
+        :return: (records, clients, phones, rejected_clients, rejected_phones) для пачки.
+        """
+        # Повторы внутри одной пачки нельзя отдать в ON CONFLICT (строка не может меняться
+        # дважды за команду), поэтому они разрешаются здесь по той же политике
+        clients = {}
+        rejected_clients = rejected_phones = 0
+        for record in batch:
+            FirstName, LastName, Email, phones = split_client_record(record)
+
+            if Email in clients:
+                if on_conflict == 'fail':
+                    raise psycopg2.errors.UniqueViolation(f'Email "{Email}" повторяется в загружаемых данных')
+                if on_conflict == 'skip':
+                    rejected_clients += 1
+                    rejected_phones += len(phones)
+                    continue
+                phones = clients[Email][2] + phones
+            clients[Email] = (FirstName, LastName, phones)
+
+        sql = {
+            'skip': 'ON CONFLICT (Email) DO NOTHING',
+            'upsert': 'ON CONFLICT (Email) DO UPDATE SET FirstName=EXCLUDED.FirstName, LastName=EXCLUDED.LastName',
+            'fail': '',
+        }[on_conflict]
+        ids = dict(psycopg2.extras.execute_values(cur, f"""
+            INSERT INTO Clients (FirstName, LastName, Email)
+            VALUES %s {sql}
+            RETURNING Email, ClientID;
+            """, [(FirstName, LastName, Email) for Email, (FirstName, LastName, _) in clients.items()],
+            page_size=len(clients), fetch=True))
+        rejected_clients += len(clients) - len(ids)
+
+        phones = {}
+        for Email, (_, _, numbers) in clients.items():
+            for PhoneNumber in numbers:
+                if Email not in ids or (on_conflict == 'skip' and PhoneNumber in phones):
+                    rejected_phones += 1
+                elif on_conflict == 'fail' and PhoneNumber in phones:
+                    raise psycopg2.errors.UniqueViolation(
+                        f'PhoneNumber "{PhoneNumber}" повторяется в загружаемых данных')
+                else:
+                    phones[PhoneNumber] = ids[Email]
+
+        inserted_phones = 0
+        if phones:
+            sql = {
+                'skip': 'ON CONFLICT (PhoneNumber) DO NOTHING',
+                'upsert': 'ON CONFLICT (PhoneNumber) DO UPDATE SET ClientID=EXCLUDED.ClientID',
+                'fail': '',
+            }[on_conflict]
+            inserted_phones = len(psycopg2.extras.execute_values(cur, f"""
+                INSERT INTO ClientPhones (ClientID, PhoneNumber)
+                VALUES %s {sql}
+                RETURNING PhoneID;
+                """, [(ClientID, PhoneNumber) for PhoneNumber, ClientID in phones.items()],
+                page_size=len(phones), fetch=True))
+            rejected_phones += len(phones) - inserted_phones
+
+        return len(batch), len(ids), inserted_phones, rejected_clients, rejected_phones
+
+    @metrics.instrumented
+    def export_clients(self, path: str, fmt: str = None, rows_per_file: int = None, compress: bool = None,
+                       FirstName: str = None, LastName: str = None, Email: str = None, PhoneNumber: str = None,
+                       after_id: int = None, changed_since=None, itersize: int = 10000) -> ExportReport:
+        """
+        Потоково выгружает клиентов с их телефонами (см. StorageBackend.export_clients).
+        Вся выгрузка читается из одного снимка базы (REPEATABLE READ). CSV формирует сервер
+        через COPY ... TO STDOUT, по одной команде на файл с границами по ClientID;
+        JSONL читается серверным курсором порциями по itersize готовых строк.
+
+        Отметка watermark - время начала снимка. Транзакция, начатая раньше выгрузки,
+        но зафиксированная после нее, получает более раннее UpdatedAt, поэтому при
+        инкрементальной выгрузке стоит передавать changed_since с запасом.
+
+        :return: Итоговый отчет о выгрузке.
+        """
+        criteria = {'FirstName': FirstName, 'LastName': LastName, 'Email': Email,
+                    'PhoneNumber': PhoneNumber, 'changed_since': changed_since}
+        started = time.perf_counter()
+        with ExportWriter(path, fmt, rows_per_file, compress) as writer, self.pool.transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(queries.EXPORT_SNAPSHOT)
+                watermark = cur.fetchone()[0]
+            if writer.fmt == 'csv':
+                last_id = self._export_csv(conn, writer, after_id, criteria)
+            else:
+                last_id = self._export_jsonl(conn, writer, after_id, criteria, itersize)
+        return ExportReport(writer.paths, writer.rows, after_id if last_id is None else last_id,
+                            watermark, time.perf_counter() - started)
+
+    @staticmethod
+    def _export_csv(conn, writer: ExportWriter, after_id: int, criteria: dict) -> int:
+        """
+        :return: Наибольший выгруженный ClientID или None, если выгружать нечего.
+        """
+        with conn.cursor() as cur:
+            cur.execute(*queries.export_params('last_id', after_id=after_id, **criteria))
+            last_id = cur.fetchone()[0]
+            while True:
+                until_id = None
+                if writer.rows_per_file and last_id is not None:
+                    # Файл заканчивается на rows_per_file-м клиенте после предыдущей границы
+                    cur.execute(*queries.export_params('boundary', after_id=after_id,
+                                                       offset=writer.rows_per_file - 1, **criteria))
+                    row = cur.fetchone()
+                    until_id = row[0] if row is not None and row[0] < last_id else None
+                sql, params = queries.export_params('csv', after_id=after_id, until_id=until_id, **criteria)
+                cur.copy_expert(cur.mogrify(sql, params), writer.next_file())
+                writer.rows += cur.rowcount
+                if until_id is None:
+                    return last_id
+                after_id = until_id
+
+    @staticmethod
+    def _export_jsonl(conn, writer: ExportWriter, after_id: int, criteria: dict, itersize: int) -> int:
+        """
+        :return: Наибольший выгруженный ClientID или None, если выгружать нечего.
+        """
+        last_id = None
+        with conn.cursor(name='export_clients') as cur:
+            cur.execute(*queries.export_params('jsonl', after_id=after_id, **criteria))
+            while True:
+                rows = cur.fetchmany(itersize)
+                if not rows:
+                    return last_id
+                writer.write_rows([line for _, line in rows])
+                last_id = rows[-1][0]
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository() -> StorageBackend:
+    """
+    Возвращает общее для модуля хранилище. При первом вызове создает ClientRepository
+    по параметрам из переменных окружения.
+    """
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                cache = ClientCache(cache_size, cache_ttl) if cache_size > 0 else None
+                instrumentation = None
+                if metrics_enabled or slow_query_ms:
+                    instrumentation = Instrumentation(
+                        enabled=metrics_enabled,
+                        slow_query_threshold=float(slow_query_ms) / 1000 if slow_query_ms else None)
+                _repository = ClientRepository(cache=cache, instrumentation=instrumentation,
+                                               min_size=pool_min_size, max_size=pool_max_size,
+                                               database=database, user=user, password=password)
+    return _repository
+
+
+def set_repository(repository: StorageBackend) -> None:
+    """
+    Подменяет общее хранилище, через которое работают функции модуля,
+    например на MemoryBackend для тестов.
+
+    :param repository: Новое хранилище.
+    """
+    global _repository
+    with _repository_lock:
+        _repository = repository
+
+
+def export_metrics(fmt: str = 'prometheus') -> str:
+    """
+    Выгружает метрики общего хранилища (включаются переменной окружения metrics_enabled=1).
+
+    :param fmt: 'prometheus' или 'json'.
+    :return: Текст снимка метрик или None, если метрики не собираются.
+    """
+    instrumentation = get_repository().instrumentation
+    if instrumentation is None:
+        return None
+    if fmt == 'json':
+        return instrumentation.to_json(ensure_ascii=False)
+    if fmt == 'prometheus':
+        return instrumentation.to_prometheus()
+    raise ValueError('fmt должен быть "prometheus" или "json"')
 
 
 def create_database() -> None:
@@ -15,33 +944,8 @@ def create_database() -> None:
     Удаляет таблицы, если они уже существуют.
     """
     try:
-        with psycopg2.connect(database=database, user=user, password=password) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                DROP TABLE IF EXISTS ClientPhones;
-                DROP TABLE IF EXISTS Clients;
-                """)
-
-                cur.execute("""
-                CREATE TABLE IF NOT EXISTS Clients
-                (
-                    ClientID serial PRIMARY KEY,
-                    FirstName varchar(50) NOT NULL,
-                    LastName varchar(50) NOT NULL,
-                    Email varchar(100) NOT NULL UNIQUE
-                );
-                """)
-
-                cur.execute("""
-                CREATE TABLE IF NOT EXISTS ClientPhones
-                (
-                    PhoneID serial PRIMARY KEY,
-                    ClientID integer REFERENCES Clients(ClientID),
-                    PhoneNumber varchar(20) NOT NULL UNIQUE
-                );
-                """)
-                conn.commit()
-                print('Таблицы успешно созданы!\n')
+        get_repository().create_database()
+        print('Таблицы успешно созданы!\n')
     except Exception as e:
         print(e)
 
@@ -57,27 +961,13 @@ def add_client(FirstName: str, LastName: str, Email: str, PhoneNumber: str = Non
     :param PhoneNumber: Номер телефона клиента.
     """
     try:
-        with psycopg2.connect(database=database, user=user, password=password) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                INSERT INTO Clients (FirstName, LastName, Email)
-                VALUES (%s, %s, %s)
-                RETURNING ClientID, FirstName, LastName, Email;
-                """, (FirstName, LastName, Email))
-                client = cur.fetchone()
-
-                if PhoneNumber:
-                    cur.execute("""
-                    INSERT INTO ClientPhones (ClientID, PhoneNumber)
-                    VALUES (%s, %s)
-                    RETURNING PhoneNumber;
-                    """, (client[0], PhoneNumber))
-                    phone = cur.fetchone()
-                    print(f'В базу добавлены данные о новом клиенте:\nFirstName: {client[1]}\n'
-                          f'LastName: {client[2]}\nEmail: {client[3]}\nPhoneNumber: {phone[0]}\n')
-                else:
-                    print(f'В базу добавлены данные о новом клиенте:\nFirstName: {client[1]}\n'
-                          f'LastName: {client[2]}\nEmail: {client[3]}\n')
+        client = get_repository().add_client(FirstName, LastName, Email, PhoneNumber)
+        if client[4]:
+            print(f'В базу добавлены данные о новом клиенте:\nFirstName: {client[1]}\n'
+                  f'LastName: {client[2]}\nEmail: {client[3]}\nPhoneNumber: {client[4]}\n')
+        else:
+            print(f'В базу добавлены данные о новом клиенте:\nFirstName: {client[1]}\n'
+                  f'LastName: {client[2]}\nEmail: {client[3]}\n')
     except Exception as e:
         print(e)
 
@@ -90,21 +980,9 @@ def add_phonenumber(ClientID: int, PhoneNumber: str) -> None:
     :param PhoneNumber: Номер телефона клиента.
     """
     try:
-        with psycopg2.connect(database=database, user=user, password=password) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                SELECT FirstName, LastName, Email FROM Clients
-                WHERE ClientID=%s
-                """, (ClientID,))
-                client = cur.fetchone()
-
-                cur.execute("""
-                INSERT INTO ClientPhones (ClientID, PhoneNumber)
-                VALUES (%s, %s)
-                RETURNING PhoneNumber;
-                """, (ClientID, PhoneNumber))
-                print(f'Клиенту под идентификатором: {ClientID} ({client[0]} {client[1]}, {client[2]})\n'
-                      f'добавлен номер телефона: {PhoneNumber}\n')
+        client = get_repository().add_phonenumber(ClientID, PhoneNumber)
+        print(f'Клиенту под идентификатором: {ClientID} ({client[0]} {client[1]}, {client[2]})\n'
+              f'добавлен номер телефона: {PhoneNumber}\n')
     except Exception as e:
         print(e)
 
@@ -119,31 +997,21 @@ def update_client_data(ClientID: int, FirstName: str = None, LastName: str = Non
     :param Email: Новый email клиента.
     """
     try:
-        with psycopg2.connect(database=database, user=user, password=password) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                UPDATE Clients
-                SET FirstName=COALESCE(%s, FirstName),
-                    LastName=COALESCE(%s, LastName),
-                    Email=COALESCE(%s, Email)
-                WHERE ClientID=%s
-                RETURNING FirstName, LastName, Email;
-                """, (FirstName, LastName, Email, ClientID))
-                client = cur.fetchone()
+        client = get_repository().update_client_data(ClientID, FirstName, LastName, Email)
 
-                if client:
-                    data = {
-                        'FirstName': [client[0], FirstName],
-                        'LastName': [client[1], LastName],
-                        'Email': [client[2], Email],
-                    }
-                    print(f'У клиента под идентификатором "{ClientID}" изменились данные:')
-                    for k, v in data.items():
-                        if v[1]:
-                            print(f'{k}: {v[0]}')
-                    print()
-                else:
-                    print(f'Клиента под идентификатором "{ClientID}" не существует\n')
+        if client:
+            data = {
+                'FirstName': [client[0], FirstName],
+                'LastName': [client[1], LastName],
+                'Email': [client[2], Email],
+            }
+            print(f'У клиента под идентификатором "{ClientID}" изменились данные:')
+            for k, v in data.items():
+                if v[1]:
+                    print(f'{k}: {v[0]}')
+            print()
+        else:
+            print(f'Клиента под идентификатором "{ClientID}" не существует\n')
     except Exception as e:
         print(e)
 
@@ -157,28 +1025,12 @@ def update_phonenumber(ClientID: int, old_phone: str = None, new_phone: str = No
     :param new_phone: Новый номер телефона.
     """
     try:
-        with psycopg2.connect(database=database, user=user, password=password) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                SELECT FirstName, LastName, Email FROM Clients
-                WHERE ClientID=%s
-                """, (ClientID,))
-                client = cur.fetchone()
-
-                cur.execute("""
-                UPDATE ClientPhones
-                SET PhoneNumber=COALESCE(%s, PhoneNumber)
-                WHERE ClientID=%s AND PhoneNumber=%s
-                RETURNING PhoneNumber;
-                """, (new_phone, ClientID, old_phone))
-                phone = cur.fetchone()
-
-                if client and phone:
-                    print(f'У клиента под идентификатором "{ClientID}" изменился номер телефона:\n'
-                          f'old phone number: {old_phone}\nnew phone number: {new_phone}\n')
-                else:
-                    print(f'Клиента под идентификатором "{ClientID}" не существует '
-                          f'или у него нет номера "{old_phone}"\n')
+        if get_repository().update_phonenumber(ClientID, old_phone, new_phone):
+            print(f'У клиента под идентификатором "{ClientID}" изменился номер телефона:\n'
+                  f'old phone number: {old_phone}\nnew phone number: {new_phone}\n')
+        else:
+            print(f'Клиента под идентификатором "{ClientID}" не существует '
+                  f'или у него нет номера "{old_phone}"\n')
     except Exception as e:
         print(e)
 
@@ -191,22 +1043,11 @@ def delete_clientphone(ClientID: int, PhoneNumber: str) -> None:
     :param PhoneNumber: Номер телефона клиента.
     """
     try:
-        with psycopg2.connect(database=database, user=user, password=password) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                SELECT PhoneID FROM ClientPhones WHERE ClientID=%s AND PhoneNumber=%s
-                """, (ClientID, PhoneNumber))
-                PhoneID = cur.fetchone()
-
-                if PhoneID:
-                    cur.execute("""
-                    DELETE FROM ClientPhones WHERE PhoneID=%s
-                    """, (PhoneID,))
-                    conn.commit()
-                    print('Номер телефона успешно удален!\n')
-                else:
-                    print(f'Клиента под идентификатором "{ClientID}" не существует '
-                          f'или у него нет номера "{PhoneNumber}"\n')
+        if get_repository().delete_clientphone(ClientID, PhoneNumber):
+            print('Номер телефона успешно удален!\n')
+        else:
+            print(f'Клиента под идентификатором "{ClientID}" не существует '
+                  f'или у него нет номера "{PhoneNumber}"\n')
     except Exception as e:
         print(e)
 
@@ -218,27 +1059,10 @@ def delete_client(ClientID: int) -> None:
     :param ClientID: Идентификатор клиента.
     """
     try:
-        with psycopg2.connect(database=database, user=user, password=password) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                SELECT FirstName, LastName, Email FROM Clients
-                WHERE ClientID=%s
-                """, (ClientID,))
-                client = cur.fetchone()
-
-                cur.execute("""
-                DELETE FROM ClientPhones WHERE ClientID=%s
-                """, (ClientID,))
-
-                cur.execute("""
-                DELETE FROM Clients WHERE ClientID=%s
-                """, (ClientID,))
-                conn.commit()
-
-                if client:
-                    print(f'Данные о клиенте под идентификатором "{ClientID}" удалены!\n')
-                else:
-                    print(f'Клиента под идентификатором "{ClientID}" не существует!\n')
+        if get_repository().delete_client(ClientID):
+            print(f'Данные о клиенте под идентификатором "{ClientID}" удалены!\n')
+        else:
+            print(f'Клиента под идентификатором "{ClientID}" не существует!\n')
     except Exception as e:
         print(e)
 
@@ -253,57 +1077,130 @@ def find_client(FirstName: str = None, LastName: str = None, Email: str = None,
     :param PhoneNumber: Номер телефона клиента.
     """
     try:
-        with psycopg2.connect(database=database, user=user, password=password) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                SELECT C.ClientID, C.FirstName, C.LastName, C.Email, ARRAY_AGG(CP.PhoneNumber) AS PhoneNumbers
-                FROM Clients C
-                LEFT JOIN ClientPhones CP ON C.ClientID = CP.ClientID
-                WHERE (C.FirstName = %s OR %s IS NULL)
-                AND (C.LastName = %s OR %s IS NULL)
-                AND (C.Email = %s OR %s IS NULL)
-                AND (CP.PhoneNumber=%s OR %s IS NULL)
-                GROUP BY C.ClientID, C.FirstName, C.LastName, C.Email;
-                """, (FirstName, FirstName, LastName, LastName, Email, Email, PhoneNumber, PhoneNumber))
-                clients = cur.fetchall()
-
-                if clients:
-                    for client in clients:
-                        print(f'Данные найденного клиента:\nClientID: {client[0]}\nFirstName: {client[1]}\n'
-                              f'LastName: {client[2]}\nEmail: {client[3]}\nPhoneNumber: {client[4]}\n')
-                else:
-                    print(f'Клиента не существует!\n')
+        repository = get_repository()
+        if FirstName is None and LastName is None and (Email is None) != (PhoneNumber is None):
+            # Точечный поиск по Email или телефону идет через кэш хранилища
+            _print_clients(repository.find_client(Email=Email, PhoneNumber=PhoneNumber))
+        else:
+            _print_clients(repository.iter_clients(FirstName, LastName, Email, PhoneNumber))
     except Exception as e:
         print(e)
 
 
-# Пример вызова функций
-create_database()
-add_client('Алексей', 'Бубнов', 'buba@mail.ru')
-add_client('Матвей', 'Ярцев', 'motya@mail.ru', '+7-999-999-99-22')
-add_client('Петр', 'Максимов', 'maks@mail.ru', '+7-999-999-99-22')
-add_client('Григорий', 'Боров', 'bor@mail.ru', '+7-999-999-99-44')
-add_client('Иван', 'Матросов', 'matros@mail.ru')
-add_client('Иван', 'Богатырев', 'ivan@mail.ru', '+7-999-999-99-66')
-add_phonenumber(1, '+7-999-999-99-11')
-add_phonenumber(1, '+7-999-999-11-11')
-add_phonenumber(3, '+7-999-999-99-33')
-add_phonenumber(6, '+7-999-999-66-66')
-update_client_data(1, 'Бубен', 'Алексеев', 'alex@mail.ru')
-update_client_data(2, LastName='Албанов')
-update_client_data(-1, 'Алекс', 'Смирнов', 'true@mail.ru')
-update_client_data(1, Email='bor@mail.ru')
-update_phonenumber(1, '+7-999-999-99-11', '+7-999-999-91-11')
-update_phonenumber(4, '+7-999-999-99-44', '+7-999-999-91-11')
-update_phonenumber(55, '+7-999-999-99-44', '+7-999-999-91-11')
-delete_clientphone(1, '+7-999-999-11-11')
-delete_clientphone(2, '+7-944-444-44-44')
-delete_clientphone(-1, '+7-944-444-44-44')
-delete_clientphone(4, '+7-999-999-99-44')
-delete_client(1)
-delete_client(3)
-delete_client(4)
-find_client(LastName='Матросов')
-find_client(FirstName='Евгений')
-find_client(Email='motya@mail.ru')
-find_client(FirstName='Иван')
+def search_phones(PhoneNumber: str, mode: str = 'prefix', limit: int = 20) -> None:
+    """
+    Ищет клиентов по части номера телефона без учета форматирования номера.
+
+    :param PhoneNumber: Искомые цифры номера.
+    :param mode: 'prefix' (начало номера), 'suffix' (конец номера) или 'substring' (любая часть).
+    :param limit: Максимальное количество клиентов.
+    """
+    try:
+        _print_clients(get_repository().search_phones(PhoneNumber, mode, limit))
+    except Exception as e:
+        print(e)
+
+
+def search_clients(text: str, mode: str = 'prefix', fields: tuple = queries.SEARCH_FIELDS, limit: int = 20) -> None:
+    """
+    Ищет клиентов по началу ('prefix') или похожести ('fuzzy') имени, фамилии и Email без учета регистра.
+
+    :param text: Строка поиска.
+    :param mode: 'prefix' или 'fuzzy'.
+    :param fields: В каких полях искать: FirstName, LastName, Email.
+    :param limit: Максимальное количество клиентов.
+    """
+    try:
+        _print_clients(get_repository().search_clients(text, mode, fields, limit))
+    except Exception as e:
+        print(e)
+
+
+def _print_clients(clients) -> None:
+    found = False
+    for client in clients:
+        found = True
+        print(f'Данные найденного клиента:\nClientID: {client.ClientID}\nFirstName: {client.FirstName}\n'
+              f'LastName: {client.LastName}\nEmail: {client.Email}\nPhoneNumber: {list(client.PhoneNumbers)}\n')
+
+    if not found:
+        print(f'Клиента не существует!\n')
+
+
+def bulk_load(source, batch_size: int = 1000, on_conflict: str = 'skip') -> None:
+    """
+    Массово загружает клиентов и их телефоны в таблицы Clients и ClientPhones.
+
+    :param source: Итерируемый объект с записями (FirstName, LastName, Email, [PhoneNumber, ...])
+                   или путь к файлу .csv / .jsonl.
+    :param batch_size: Количество записей в одной пачке.
+    :param on_conflict: Политика для существующих Email и PhoneNumber: 'skip', 'upsert' или 'fail'.
+    """
+    try:
+        report = get_repository().bulk_load(source, batch_size, on_conflict)
+        print(f'Загружено записей: {report.records} за {report.seconds:.2f} с '
+              f'({report.rows_per_sec:.0f} записей/с)\nClients: {report.clients}\nClientPhones: {report.phones}\n'
+              f'Отклонено клиентов: {report.rejected_clients}\nОтклонено телефонов: {report.rejected_phones}\n')
+    except Exception as e:
+        print(e)
+
+
+def export_clients(path: str, fmt: str = None, rows_per_file: int = None, compress: bool = None,
+                   after_id: int = None, changed_since=None) -> None:
+    """
+    Выгружает клиентов и их телефоны в файлы .csv или .jsonl (с .gz - сжатые).
+
+    :param path: Путь к файлу выгрузки.
+    :param fmt: 'csv' или 'jsonl', если формат не следует из расширения.
+    :param rows_per_file: Максимальное количество клиентов в одном файле.
+    :param compress: Сжимать gzip независимо от расширения.
+    :param after_id: Выгрузить только клиентов с ClientID больше указанного.
+    :param changed_since: Выгрузить только клиентов, измененных не раньше этого времени.
+    """
+    try:
+        report = get_repository().export_clients(path, fmt, rows_per_file, compress, after_id=after_id,
+                                                 changed_since=changed_since)
+        print(f'Выгружено клиентов: {report.rows} за {report.seconds:.2f} с ({report.rows_per_sec:.0f} записей/с)\n'
+              f'Файлы: {", ".join(report.files)}\nПоследний ClientID: {report.last_id}\n'
+              f'Отметка для следующей выгрузки: {report.watermark}\n')
+    except Exception as e:
+        print(e)
+
+
+def main() -> None:
+    """
+    Пример вызова функций.
+    """
+    create_database()
+    add_client('Алексей', 'Бубнов', 'buba@mail.ru')
+    add_client('Матвей', 'Ярцев', 'motya@mail.ru', '+7-999-999-99-22')
+    add_client('Петр', 'Максимов', 'maks@mail.ru', '+7-999-999-99-22')
+    add_client('Григорий', 'Боров', 'bor@mail.ru', '+7-999-999-99-44')
+    add_client('Иван', 'Матросов', 'matros@mail.ru')
+    add_client('Иван', 'Богатырев', 'ivan@mail.ru', '+7-999-999-99-66')
+    add_phonenumber(1, '+7-999-999-99-11')
+    add_phonenumber(1, '+7-999-999-11-11')
+    add_phonenumber(3, '+7-999-999-99-33')
+    add_phonenumber(6, '+7-999-999-66-66')
+    update_client_data(1, 'Бубен', 'Алексеев', 'alex@mail.ru')
+    update_client_data(2, LastName='Албанов')
+    update_client_data(-1, 'Алекс', 'Смирнов', 'true@mail.ru')
+    update_client_data(1, Email='bor@mail.ru')
+    update_phonenumber(1, '+7-999-999-99-11', '+7-999-999-91-11')
+    update_phonenumber(4, '+7-999-999-99-44', '+7-999-999-91-11')
+    update_phonenumber(55, '+7-999-999-99-44', '+7-999-999-91-11')
+    delete_clientphone(1, '+7-999-999-11-11')
+    delete_clientphone(2, '+7-944-444-44-44')
+    delete_clientphone(-1, '+7-944-444-44-44')
+    delete_clientphone(4, '+7-999-999-99-44')
+    delete_client(1)
+    delete_client(3)
+    delete_client(4)
+    find_client(LastName='Матросов')
+    find_client(FirstName='Евгений')
+    find_client(Email='motya@mail.ru')
+    find_client(FirstName='Иван')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+"""
+Асинхронный API для работы с клиентами поверх psycopg 3 и AsyncConnectionPool.
+SQL и типы результатов общие с синхронным homework.py (см. queries.py).
+"""
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import time
+
+import metrics
+import queries
+from metrics import Instrumentation
+from queries import ClientRecord
+
+# Загрузка переменных окружения
+load_dotenv()
+database = os.getenv("database")
+user = os.getenv("user")
+password = os.getenv("password")
+pool_min_size = int(os.getenv("pool_min_size", 1))
+pool_max_size = int(os.getenv("pool_max_size", 10))
+metrics_enabled = os.getenv("metrics_enabled", "0") == "1"
+slow_query_ms = os.getenv("slow_query_ms")
+
+
+def _count_begin(conn, call: metrics.Call) -> None:
+    # Вне autocommit psycopg сам отправляет BEGIN перед первым запросом транзакции
+    if not conn.autocommit and conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE:
+        call.add_round_trip(0.0)
+
+
+class _InstrumentedCursor(psycopg.AsyncCursor):
+    """
+    Асинхронный курсор, который сообщает о запросах текущей операции (см. metrics.InstrumentedCursor).
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        call = metrics.current_call()
+        if call is None:
+            return await super().execute(query, params, **kwargs)
+        _count_begin(self.connection, call)
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            rows = self.rowcount if self.description is not None else 0
+            call.add_query(query, time.perf_counter() - started, max(rows, 0))
+
+
+class _InstrumentedServerCursor(psycopg.AsyncServerCursor):
+    """
+    Асинхронный серверный курсор, который учитывает DECLARE и выборки FETCH по itersize строк.
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        call = metrics.current_call()
+        if call is None:
+            return await super().execute(query, params, **kwargs)
+        _count_begin(self.connection, call)
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            call.add_query(query, time.perf_counter() - started)
+
+    def __aiter__(self):
+        call = metrics.current_call()
+        if call is None:
+            return super().__aiter__()
+        return self._iter_rows_instrumented(call)
+
+    async def _iter_rows_instrumented(self, call: metrics.Call):
+        # До psycopg 3.3 __aiter__ - асинхронный генератор, а __anext__ у курсора нет
+        iterator = super().__aiter__()
+        rows, seconds, exhausted = 0, 0.0, False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    row = await iterator.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    return
+                finally:
+                    seconds += time.perf_counter() - started
+                rows += 1
+                yield row
+        finally:
+            # psycopg 3 прекращает выборку после неполной страницы
+            fetches = rows // self.itersize + 1 if exhausted else -(-rows // self.itersize)
+            call.add_round_trip(seconds, rows, fetches)
+
+
+async def _configure(conn) -> None:
+    # Одиночный запрос не требует отдельных BEGIN и COMMIT, транзакции открываются явно
+    await conn.set_autocommit(True)
+
+
+async def _configure_instrumented(conn) -> None:
+    await _configure(conn)
+    conn.server_cursor_factory = _InstrumentedServerCursor
+
+
+class AsyncClientRepository:
+    """
+    Асинхронный аналог homework.ClientRepository: те же операции и те же результаты,
+    но без блокировки цикла событий. Перед использованием пул нужно открыть
+    через open() или async with.
+    """
+
+    def __init__(self, pool: AsyncConnectionPool = None, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 30.0, instrumentation: Instrumentation = None, **conn_params) -> None:
+        """
+        :param pool: Готовый асинхронный пул соединений.
+        :param min_size: Количество соединений, открываемых сразу.
+        :param max_size: Максимальное количество одновременно открытых соединений.
+        :param timeout: Сколько секунд ждать свободное соединение.
+        :param instrumentation: Сбор метрик операций. Запросы учитываются только в пуле,
+                                созданном репозиторием.
+        :param conn_params: Параметры для psycopg.AsyncConnection.connect() (dbname, user, password, ...).
+        """
+        if pool is None:
+            configure = _configure
+            if instrumentation is not None:
+                conn_params.setdefault('cursor_factory', _InstrumentedCursor)
+                configure = _configure_instrumented
+            pool = AsyncConnectionPool(kwargs=conn_params, min_size=min_size, max_size=max_size,
+                                       timeout=timeout, check=AsyncConnectionPool.check_connection,
+                                       configure=configure, open=False)
+        self.pool = pool
+        self.instrumentation = instrumentation
+
+    async def open(self) -> None:
+        await self.pool.open()
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    @asynccontextmanager
+    async def _connection(self):
+        """
+        Соединение из пула в режиме autocommit на время блока async with; учитывает время его получения.
+        """
+        call = metrics.current_call()
+        if call is None:
+            async with self.pool.connection() as conn:
+                yield conn
+            return
+        started = time.perf_counter()
+        async with self.pool.connection() as conn:
+            call.connect_seconds += time.perf_counter() - started
+            yield conn
+
+    @asynccontextmanager
+    async def _transaction(self):
+        """
+        Соединение на время блока async with, в котором все запросы выполняются одной транзакцией.
+        При успешном выходе транзакция фиксируется, при исключении откатывается. Учитывает BEGIN и COMMIT.
+        """
+        call = metrics.current_call()
+        async with self._connection() as conn:
+            started = time.perf_counter()
+            async with conn.transaction():
+                if call is not None:
+                    call.add_round_trip(time.perf_counter() - started)
+                yield conn
+                started = time.perf_counter()
+            if call is not None:
+                call.add_round_trip(time.perf_counter() - started)
+
+    @metrics.instrumented
+    async def create_database(self) -> None:
+        """
+        Создает таблицы Clients и ClientPhones, если они не существуют.
+        Удаляет таблицы, если они уже существуют.
+        """
+        async with self._transaction() as conn:
+            async with conn.cursor() as cur:
+                for sql in queries.CREATE_DATABASE:
+                    await cur.execute(sql)
+                try:
+                    async with conn.transaction():
+                        await cur.execute(queries.CREATE_TRIGRAM_INDEXES)
+                except (psycopg.errors.FeatureNotSupported, psycopg.errors.UndefinedFile,
+                        psycopg.errors.InsufficientPrivilege):
+                    # Без pg_trgm поиск по подстроке номера работает полным просмотром, а нечеткий поиск недоступен
+                    pass
+
+    @metrics.instrumented
+    async def add_client(self, FirstName: str, LastName: str, Email: str, PhoneNumber: str = None) -> tuple:
+        """
+        Добавляет нового клиента в таблицу Clients.
+        Если указан номер телефона, добавляет его в таблицу ClientPhones.
+
+        :return: (ClientID, FirstName, LastName, Email, PhoneNumber) добавленного клиента.
+        """
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(queries.ADD_CLIENT, (FirstName, LastName, Email, PhoneNumber or None))
+                return await cur.fetchone()
+
+    @metrics.instrumented
+    async def add_phonenumber(self, ClientID: int, PhoneNumber: str) -> tuple:
+        """
+        Добавляет номер телефона клиента в таблицу ClientPhones.
+
+        :return: (FirstName, LastName, Email) клиента.
+        """
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(queries.ADD_PHONE, (ClientID, PhoneNumber))
+                return await cur.fetchone()
+
+    @metrics.instrumented
+    async def update_client_data(self, ClientID: int, FirstName: str = None, LastName: str = None,
+                                 Email: str = None) -> tuple:
+        """
+        Обновляет данные клиента в таблице Clients.
+
+        :return: (FirstName, LastName, Email) после изменения или None, если клиента не существует.
+        """
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(queries.UPDATE_CLIENT, (FirstName, LastName, Email, ClientID))
+                return await cur.fetchone()
+
+    @metrics.instrumented
+    async def update_phonenumber(self, ClientID: int, old_phone: str = None, new_phone: str = None) -> bool:
+        """
+        Обновляет номер телефона клиента в таблице ClientPhones.
+
+        :return: True, если у клиента был номер old_phone и он изменен.
+        """
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(queries.UPDATE_PHONE, (new_phone, ClientID, old_phone))
+                return bool(await cur.fetchone())
+
+    @metrics.instrumented
+    async def delete_clientphone(self, ClientID: int, PhoneNumber: str) -> bool:
+        """
+        Удаляет номер телефона клиента из таблицы ClientPhones.
+
+        :return: True, если номер был найден и удален.
+        """
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(queries.DELETE_PHONE, (ClientID, PhoneNumber))
+                return bool(await cur.fetchone())
+
+    @metrics.instrumented
+    async def delete_client(self, ClientID: int) -> bool:
+        """
+        Удаляет данные клиента из таблицы Clients и все его номера телефонов из таблицы ClientPhones.
+
+        :return: True, если клиент существовал.
+        """
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(queries.DELETE_CLIENT, (ClientID, ClientID))
+                return bool(await cur.fetchone())
+
+    @metrics.instrumented
+    async def iter_clients(self, FirstName: str = None, LastName: str = None, Email: str = None,
+                           PhoneNumber: str = None, after_id: int = None, limit: int = None,
+                           itersize: int = 2000):
+        """
+        Ищет клиентов по заданным параметрам и отдает результат потоково, в порядке ClientID,
+        через серверный курсор. Параметры такие же, как у ClientRepository.iter_clients.
+
+        :return: Асинхронный генератор ClientRecord.
+        """
+        sql, params = queries.find_client_params(FirstName, LastName, Email, PhoneNumber, after_id, limit)
+        async with self._transaction() as conn:
+            async with conn.cursor(name='iter_clients') as cur:
+                cur.itersize = itersize
+                await cur.execute(sql, params)
+                async for row in cur:
+                    yield ClientRecord.from_row(row)
+
+    @metrics.instrumented
+    async def find_client(self, FirstName: str = None, LastName: str = None, Email: str = None,
+                          PhoneNumber: str = None) -> list:
+        """
+        Ищет клиента в таблице Clients по заданным параметрам.
+
+        :return: Список ClientRecord.
+        """
+        sql, params = queries.find_client_params(FirstName, LastName, Email, PhoneNumber)
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, params)
+                return [ClientRecord.from_row(row) for row in await cur.fetchall()]
+
+    @metrics.instrumented
+    async def search_phones(self, PhoneNumber: str, mode: str = 'prefix', limit: int = 20) -> list:
+        """
+        Ищет клиентов по началу, концу или части номера телефона (см. StorageBackend.search_phones).
+
+        :return: Список ClientRecord.
+        """
+        sql, params = queries.search_phones_params(PhoneNumber, mode, limit)
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, params)
+                return [ClientRecord.from_row(row) for row in await cur.fetchall()]
+
+    @metrics.instrumented
+    async def search_clients(self, text: str, mode: str = 'prefix', fields: tuple = queries.SEARCH_FIELDS,
+                             limit: int = 20) -> list:
+        """
+        Ищет клиентов по началу или похожести имени, фамилии и Email (см. StorageBackend.search_clients).
+
+        :return: Список ClientRecord.
+        """
+        sql, params = queries.search_clients_params(text, mode, fields, limit)
+        async with self._connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, params)
+                return [ClientRecord.from_row(row) for row in await cur.fetchall()]
+
+
+async def run_concurrently(awaitables, limit: int = 10, return_exceptions: bool = False) -> list:
+    """
+    Выполняет независимые операции (например, поиски или добавления клиентов) конкурентно,
+    не более limit одновременно. Операции берутся из awaitables по мере освобождения мест,
+    поэтому источник может быть ленивым генератором.
+
+    :param awaitables: Итерируемый объект с корутинами.
+    :param limit: Максимальное количество одновременно выполняемых операций.
+    :param return_exceptions: Возвращать исключения в списке результатов вместо того, чтобы прерывать выполнение.
+    :return: Результаты в порядке исходных операций.
+    """
+    if limit < 1:
+        raise ValueError('limit должен быть положительным')
+    pending = enumerate(awaitables)
+    results = {}
+
+    async def worker() -> None:
+        for index, awaitable in pending:
+            try:
+                results[index] = await awaitable
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[index] = e
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(limit)]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        for _, awaitable in pending:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+        raise
+    return [results[index] for index in range(len(results))]
+
+
+_repository = None
+_repository_lock = asyncio.Lock()
+
+
+async def get_repository() -> AsyncClientRepository:
+    """
+    Возвращает общий для модуля AsyncClientRepository, при первом вызове создавая и открывая его
+    по параметрам из переменных окружения.
+    """
+    global _repository
+    if _repository is None:
+        async with _repository_lock:
+            if _repository is None:
+                instrumentation = None
+                if metrics_enabled or slow_query_ms:
+                    instrumentation = Instrumentation(
+                        enabled=metrics_enabled,
+                        slow_query_threshold=float(slow_query_ms) / 1000 if slow_query_ms else None)
+                repository = AsyncClientRepository(min_size=pool_min_size, max_size=pool_max_size,
+                                                   instrumentation=instrumentation,
+                                                   dbname=database, user=user, password=password)
+                await repository.open()
+                _repository = repository
+    return _repository
+
+
+async def create_database() -> None:
+    """
+    Создает таблицы Clients и ClientPhones, если они не существуют.
+    Удаляет таблицы, если они уже существуют.
+    """
+    await (await get_repository()).create_database()
+
+
+async def add_client(FirstName: str, LastName: str, Email: str, PhoneNumber: str = None) -> tuple:
+    """
+    Добавляет нового клиента в таблицу Clients.
+    Если указан номер телефона, добавляет его в таблицу ClientPhones.
+
+    :param FirstName: Имя клиента.
+    :param LastName: Фамилия клиента.
+    :param Email: Email клиента.
+    :param PhoneNumber: Номер телефона клиента.
+    :return: (ClientID, FirstName, LastName, Email, PhoneNumber) добавленного клиента.
+    """
+    return await (await get_repository()).add_client(FirstName, LastName, Email, PhoneNumber)
+
+
+async def add_phonenumber(ClientID: int, PhoneNumber: str) -> tuple:
+    """
+    Добавляет номер телефона клиента в таблицу ClientPhones.
+
+    :param ClientID: Идентификатор клиента.
+    :param PhoneNumber: Номер телефона клиента.
+    :return: (FirstName, LastName, Email) клиента.
+    """
+    return await (await get_repository()).add_phonenumber(ClientID, PhoneNumber)
+
+
+async def update_client_data(ClientID: int, FirstName: str = None, LastName: str = None,
+                             Email: str = None) -> tuple:
+    """
+    Обновляет данные клиента в таблице Clients.
+
+    :param ClientID: Идентификатор клиента.
+    :param FirstName: Новое имя клиента.
+    :param LastName: Новая фамилия клиента.
+    :param Email: Новый email клиента.
+    :return: (FirstName, LastName, Email) после изменения или None, если клиента не существует.
+    """
+    return await (await get_repository()).update_client_data(ClientID, FirstName, LastName, Email)
+
+
+async def update_phonenumber(ClientID: int, old_phone: str = None, new_phone: str = None) -> bool:
+    """
+    Обновляет номер телефона клиента в таблице ClientPhones.
+
+    :param ClientID: Идентификатор клиента.
+    :param old_phone: Старый номер телефона.
+    :param new_phone: Новый номер телефона.
+    :return: True, если у клиента был номер old_phone и он изменен.
+    """
+    return await (await get_repository()).update_phonenumber(ClientID, old_phone, new_phone)
+
+
+async def delete_clientphone(ClientID: int, PhoneNumber: str) -> bool:
+    """
+    Удаляет номер телефона клиента из таблицы ClientPhones.
+
+    :param ClientID: Идентификатор клиента.
+    :param PhoneNumber: Номер телефона клиента.
+    :return: True, если номер был найден и удален.
+    """
+    return await (await get_repository()).delete_clientphone(ClientID, PhoneNumber)
+
+
+async def delete_client(ClientID: int) -> bool:
+    """
+    Удаляет данные клиента из таблицы Clients и все его номера телефонов из таблицы ClientPhones.
+
+    :param ClientID: Идентификатор клиента.
+    :return: True, если клиент существовал.
+    """
+    return await (await get_repository()).delete_client(ClientID)
+
+
+async def find_client(FirstName: str = None, LastName: str = None, Email: str = None,
+                      PhoneNumber: str = None) -> list:
+    """
+    Ищет клиента в таблице Clients по заданным параметрам.
+
+    :param FirstName: Имя клиента.
+    :param LastName: Фамилия клиента.
+    :param Email: Email клиента.
+    :param PhoneNumber: Номер телефона клиента.
+    :return: Список ClientRecord.
+    """
+    return await (await get_repository()).find_client(FirstName, LastName, Email, PhoneNumber)
+
+
+async def search_phones(PhoneNumber: str, mode: str = 'prefix', limit: int = 20) -> list:
+    """
+    Ищет клиентов по части номера телефона без учета форматирования номера.
+
+    :param PhoneNumber: Искомые цифры номера.
+    :param mode: 'prefix' (начало номера), 'suffix' (конец номера) или 'substring' (любая часть).
+    :param limit: Максимальное количество клиентов.
+    :return: Список ClientRecord.
+    """
+    return await (await get_repository()).search_phones(PhoneNumber, mode, limit)
+
+
+async def search_clients(text: str, mode: str = 'prefix', fields: tuple = queries.SEARCH_FIELDS,
+                         limit: int = 20) -> list:
+    """
+    Ищет клиентов по началу ('prefix') или похожести ('fuzzy') имени, фамилии и Email без учета регистра.
+
+    :param text: Строка поиска.
+    :param mode: 'prefix' или 'fuzzy'.
+    :param fields: В каких полях искать: FirstName, LastName, Email.
+    :param limit: Максимальное количество клиентов.
+    :return: Список ClientRecord.
+    """
+    return await (await get_repository()).search_clients(text, mode, fields, limit)
@@ -0,0 +1,719 @@
+"""
+Хранилище клиентов в памяти процесса с той же семантикой, что и схема из create_database.
+Подходит для быстрых тестов и нагрузочных прогонов без PostgreSQL, а также как реплика
+для чтения, загруженная из снимка базы при старте (см. MemoryBackend.load_snapshot).
+"""
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from heapq import nsmallest
+from itertools import islice
+import math
+import os
+import re
+import threading
+import time
+
+import psycopg2.errors
+
+import metrics
+from metrics import Instrumentation
+from queries import (SEARCH_CLIENT_MODES, SEARCH_FIELDS, SEARCH_PHONE_MODES, ClientRecord, phone_digits,
+                     prefix_bounds)
+from storage import (ON_CONFLICT_POLICIES, BulkLoadReport, ExportReport, ExportWriter, OperationResult,
+                     StorageBackend, read_client_records, split_client_record)
+
+# Длины столбцов varchar из CREATE TABLE
+_MAX_LENGTHS = {'FirstName': 50, 'LastName': 50, 'Email': 100, 'PhoneNumber': 20}
+
+# Порог похожести оператора % из pg_trgm (pg_trgm.similarity_threshold)
+SIMILARITY_THRESHOLD = 0.3
+
+_MISSING = object()
+
+
+def trigrams(value: str) -> set:
+    """
+    Триграммы строки так же, как их считает pg_trgm: строка делится на слова из букв и цифр,
+    каждое слово дополняется двумя пробелами слева и одним справа.
+    """
+    result = set()
+    for word in re.findall(r'[^\W_]+', value.lower()):
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+class _SortedView:
+    """
+    Отсортированный список (transform(key), key) по ключам _KeyIndex для поиска по диапазону.
+    Новые ключи копятся и вливаются перед поиском, удаленные убираются сразу.
+    """
+
+    def __init__(self, keys, transform) -> None:
+        self.transform = transform
+        self.items = sorted((transform(key), key) for key in keys)
+        self.pending = []
+
+    def add(self, key) -> None:
+        self.pending.append((self.transform(key), key))
+
+    def remove(self, key) -> None:
+        item = (self.transform(key), key)
+        index = bisect_left(self.items, item)
+        if index < len(self.items) and self.items[index] == item:
+            del self.items[index]
+        else:
+            self.pending.remove(item)
+
+    def range(self, low: str, high: str):
+        """
+        :return: Генератор ключей, для которых low <= transform(key) < high, по порядку transform(key).
+        """
+        if len(self.pending) > 32:
+            self.items.extend(self.pending)
+            self.items.sort()
+        else:
+            for item in self.pending:
+                insort(self.items, item)
+        self.pending.clear()
+        for index in range(bisect_left(self.items, (low,)), len(self.items)):
+            value, key = self.items[index]
+            if value >= high:
+                break
+            yield key
+
+
+class _KeyIndex:
+    """
+    Индекс значение -> множество элементов. Большинство значений (Email, цифры номера)
+    встречаются у одного элемента, поэтому такой элемент хранится сам по себе,
+    а множество создается только для второго элемента с тем же значением.
+    Отсортированные представления для поиска по префиксу и триграммы для нечеткого поиска
+    строятся при первом обращении и дальше поддерживаются при появлении и исчезновении значений.
+    """
+
+    def __init__(self) -> None:
+        self.entries = {}
+        self._views = {}
+        self._trigrams = None
+
+    def get(self, key, default=()):
+        """
+        :return: Множество или кортеж элементов со значением key, default - если их нет.
+        """
+        items = self.entries.get(key, _MISSING)
+        if items is _MISSING:
+            return default
+        return items if isinstance(items, set) else (items,)
+
+    def add(self, key, item) -> None:
+        items = self.entries.get(key, _MISSING)
+        if isinstance(items, set):
+            items.add(item)
+            return
+        if items is not _MISSING:
+            if items != item:
+                self.entries[key] = {items, item}
+            return
+        self.entries[key] = item
+        for view in self._views.values():
+            view.add(key)
+        if self._trigrams is not None:
+            for trigram in trigrams(key):
+                self._trigrams.setdefault(trigram, set()).add(key)
+
+    def discard(self, key, item) -> None:
+        items = self.entries[key]
+        if isinstance(items, set):
+            items.discard(item)
+            if len(items) == 1:
+                self.entries[key] = next(iter(items))
+            return
+        if items != item:
+            return
+        del self.entries[key]
+        for view in self._views.values():
+            view.remove(key)
+        if self._trigrams is not None:
+            for trigram in trigrams(key):
+                keys = self._trigrams[trigram]
+                keys.discard(key)
+                if not keys:
+                    del self._trigrams[trigram]
+
+    def range(self, low: str, high: str, transform=None):
+        """
+        :return: Генератор значений, для которых low <= transform(value) < high, по порядку transform(value).
+        """
+        view = self._views.get(transform)
+        if view is None:
+            view = self._views[transform] = _SortedView(self.entries, transform or (lambda key: key))
+        return view.range(low, high)
+
+    def similar(self, text: str, threshold: float = SIMILARITY_THRESHOLD) -> list:
+        """
+        :return: Список (similarity, value) для значений с похожестью не меньше threshold.
+        """
+        if self._trigrams is None:
+            self._trigrams = {}
+            for key in self.entries:
+                for trigram in trigrams(key):
+                    self._trigrams.setdefault(trigram, set()).add(key)
+        query = trigrams(text)
+        if not query:
+            return []
+        # Похожее значение содержит не меньше need триграмм запроса, значит, хотя бы одну
+        # из len(query) - need + 1 самых редких: достаточно просмотреть только их списки
+        need = max(math.ceil(threshold * len(query)), 1)
+        postings = sorted((self._trigrams.get(trigram, ()) for trigram in query), key=len)
+        result = []
+        for key in set().union(*postings[:len(query) - need + 1]):
+            grams = trigrams(key)
+            shared = len(query & grams)
+            similarity = shared / (len(query) + len(grams) - shared)
+            if similarity >= threshold:
+                result.append((similarity, key))
+        return result
+
+
+def _reverse(value: str) -> str:
+    return value[::-1]
+
+
+def _lower(value: str) -> str:
+    # lower() всегда создает новую строку, а ключ индекса, уже записанный строчными, может быть самим значением
+    lowered = value.lower()
+    return value if lowered == value else lowered
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Реализация StorageBackend в памяти.
+
+    Клиент хранится одной записью ClientRecord (namedtuple со __slots__), телефоны - кортежем
+    в порядке добавления. Хэш-индексы по ClientID, Email, PhoneNumber, цифрам номера и lower()
+    от FirstName, LastName и Email повторяют индексы PostgreSQL; для поиска по префиксу и нечеткого
+    поиска над ними при первом обращении строятся отсортированные представления и триграммы.
+    Уникальность Email и PhoneNumber, внешний ключ телефона на клиента, NOT NULL и длины varchar
+    проверяются так же, как в базе, и нарушения выбрасывают те же исключения psycopg2.errors.
+    Все операции потокобезопасны; bulk_load (по пачкам) и execute_batch атомарны.
+    """
+
+    def __init__(self, instrumentation: Instrumentation = None) -> None:
+        """
+        :param instrumentation: Сбор метрик операций.
+        """
+        self.instrumentation = instrumentation
+        self._lock = threading.RLock()
+        self._undo = None
+        self.create_database()
+
+    @metrics.instrumented
+    def create_database(self) -> None:
+        """
+        Удаляет все данные и сбрасывает счетчик ClientID, как DROP и CREATE TABLE.
+        """
+        with self._lock:
+            self._clients = {}
+            self._order = []
+            self._by_email = {}
+            self._by_phone = {}
+            self._by_digits = _KeyIndex()
+            self._text_indexes = {field: _KeyIndex() for field in SEARCH_FIELDS}
+            self._updated_at = {}
+            self._next_id = 1
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def _replace(self, ClientID: int, record: ClientRecord) -> None:
+        """
+        Единственная точка изменения данных: заменяет запись клиента (None - удаляет)
+        и обновляет индексы только по изменившимся полям. Внутри _transaction()
+        запоминает прежнюю запись для отката.
+        """
+        old = self._clients.get(ClientID)
+        for field, index in self._text_indexes.items():
+            before = _lower(getattr(old, field)) if old is not None else None
+            after = _lower(getattr(record, field)) if record is not None else None
+            if before != after:
+                if before is not None:
+                    index.discard(before, ClientID)
+                if after is not None:
+                    index.add(after, ClientID)
+
+        if old is not None and (record is None or old.Email != record.Email):
+            del self._by_email[old.Email]
+        if record is not None:
+            self._by_email[record.Email] = ClientID
+
+        phones_before = set(old.PhoneNumbers) if old is not None else set()
+        phones_after = set(record.PhoneNumbers) if record is not None else set()
+        for PhoneNumber in phones_before - phones_after:
+            del self._by_phone[PhoneNumber]
+            self._by_digits.discard(phone_digits(PhoneNumber), PhoneNumber)
+        for PhoneNumber in phones_after - phones_before:
+            self._by_phone[PhoneNumber] = ClientID
+            self._by_digits.add(phone_digits(PhoneNumber), PhoneNumber)
+
+        # Как Clients.UpdatedAt, но числом секунд: datetime на каждого клиента занимает втрое больше.
+        # Откат тоже считается изменением, лишняя выгрузка безопаснее пропущенной
+        if record is None:
+            self._updated_at.pop(ClientID, None)
+        elif record != old:
+            self._updated_at[ClientID] = time.time()
+
+        if record is not None:
+            self._clients[ClientID] = record
+            if old is None:
+                if not self._order or ClientID > self._order[-1]:
+                    self._order.append(ClientID)
+                else:
+                    insort(self._order, ClientID)
+        elif old is not None:
+            del self._clients[ClientID]
+            del self._order[bisect_left(self._order, ClientID)]
+
+        if self._undo is not None:
+            self._undo.append((ClientID, old))
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Выполняет блок под блокировкой; при исключении откатывает все изменения блока.
+        """
+        with self._lock:
+            self._undo = []
+            try:
+                yield
+            except BaseException:
+                undo, self._undo = self._undo, None
+                for ClientID, record in reversed(undo):
+                    self._replace(ClientID, record)
+                raise
+            finally:
+                self._undo = None
+
+    @staticmethod
+    def _check(**values) -> None:
+        for column, value in values.items():
+            if value is None:
+                raise psycopg2.errors.NotNullViolation(
+                    f'null value in column "{column.lower()}" violates not-null constraint\n')
+            if len(value) > _MAX_LENGTHS[column]:
+                raise psycopg2.errors.StringDataRightTruncation(
+                    f'value too long for type character varying({_MAX_LENGTHS[column]})\n')
+
+    def _check_email(self, Email: str, ClientID: int = None) -> None:
+        if self._by_email.get(Email, ClientID) != ClientID:
+            raise psycopg2.errors.UniqueViolation(
+                f'duplicate key value violates unique constraint "clients_email_key"\n'
+                f'DETAIL:  Key (email)=({Email}) already exists.\n')
+
+    def _check_phone(self, PhoneNumber: str) -> None:
+        if PhoneNumber in self._by_phone:
+            raise psycopg2.errors.UniqueViolation(
+                f'duplicate key value violates unique constraint "clientphones_phonenumber_key"\n'
+                f'DETAIL:  Key (phonenumber)=({PhoneNumber}) already exists.\n')
+
+    @metrics.instrumented
+    def add_client(self, FirstName: str, LastName: str, Email: str, PhoneNumber: str = None) -> tuple:
+        """
+        Добавляет нового клиента и, если указан, его номер телефона.
+
+        :return: (ClientID, FirstName, LastName, Email, PhoneNumber) добавленного клиента.
+        """
+        PhoneNumber = PhoneNumber or None
+        with self._lock:
+            # Как и serial, идентификатор расходуется даже при нарушении ограничений
+            ClientID = self._next_id
+            self._next_id += 1
+            self._check(FirstName=FirstName, LastName=LastName, Email=Email)
+            self._check_email(Email)
+            if PhoneNumber is not None:
+                self._check(PhoneNumber=PhoneNumber)
+                self._check_phone(PhoneNumber)
+            self._replace(ClientID, ClientRecord(ClientID, FirstName, LastName, Email,
+                                                 (PhoneNumber,) if PhoneNumber else ()))
+        return ClientID, FirstName, LastName, Email, PhoneNumber
+
+    @metrics.instrumented
+    def add_phonenumber(self, ClientID: int, PhoneNumber: str) -> tuple:
+        """
+        Добавляет номер телефона существующему клиенту.
+
+        :return: (FirstName, LastName, Email) клиента.
+        """
+        with self._lock:
+            self._check(PhoneNumber=PhoneNumber)
+            client = self._clients.get(ClientID)
+            if client is None:
+                raise psycopg2.errors.ForeignKeyViolation(
+                    f'insert or update on table "clientphones" violates foreign key constraint '
+                    f'"clientphones_clientid_fkey"\nDETAIL:  Key (clientid)=({ClientID}) is not present in table "clients".\n')
+            self._check_phone(PhoneNumber)
+            self._replace(ClientID, client._replace(PhoneNumbers=client.PhoneNumbers + (PhoneNumber,)))
+        return client.FirstName, client.LastName, client.Email
+
+    @metrics.instrumented
+    def update_client_data(self, ClientID: int, FirstName: str = None, LastName: str = None,
+                           Email: str = None) -> tuple:
+        """
+        Обновляет переданные поля клиента.
+
+        :return: (FirstName, LastName, Email) после изменения или None, если клиента не существует.
+        """
+        with self._lock:
+            client = self._clients.get(ClientID)
+            if client is None:
+                return None
+            client = client._replace(FirstName=FirstName if FirstName is not None else client.FirstName,
+                                     LastName=LastName if LastName is not None else client.LastName,
+                                     Email=Email if Email is not None else client.Email)
+            self._check(FirstName=client.FirstName, LastName=client.LastName, Email=client.Email)
+            self._check_email(client.Email, ClientID)
+            self._replace(ClientID, client)
+        return client.FirstName, client.LastName, client.Email
+
+    @metrics.instrumented
+    def update_phonenumber(self, ClientID: int, old_phone: str = None, new_phone: str = None) -> bool:
+        """
+        Заменяет номер old_phone клиента на new_phone.
+
+        :return: True, если у клиента был номер old_phone.
+        """
+        with self._lock:
+            client = self._clients.get(ClientID)
+            if client is None or old_phone not in client.PhoneNumbers:
+                return False
+            if new_phone is not None and new_phone != old_phone:
+                self._check(PhoneNumber=new_phone)
+                self._check_phone(new_phone)
+                phones = tuple(new_phone if phone == old_phone else phone for phone in client.PhoneNumbers)
+                self._replace(ClientID, client._replace(PhoneNumbers=phones))
+        return True
+
+    @metrics.instrumented
+    def delete_clientphone(self, ClientID: int, PhoneNumber: str) -> bool:
+        """
+        Удаляет номер телефона клиента.
+
+        :return: True, если номер был найден и удален.
+        """
+        with self._lock:
+            client = self._clients.get(ClientID)
+            if client is None or PhoneNumber not in client.PhoneNumbers:
+                return False
+            phones = tuple(phone for phone in client.PhoneNumbers if phone != PhoneNumber)
+            self._replace(ClientID, client._replace(PhoneNumbers=phones))
+        return True
+
+    @metrics.instrumented
+    def delete_client(self, ClientID: int) -> bool:
+        """
+        Удаляет клиента вместе со всеми его номерами.
+
+        :return: True, если клиент существовал.
+        """
+        with self._lock:
+            if ClientID not in self._clients:
+                return False
+            self._replace(ClientID, None)
+        return True
+
+    @metrics.instrumented
+    def get_client(self, ClientID: int) -> ClientRecord:
+        return self._clients.get(ClientID)
+
+    @metrics.instrumented
+    def get_client_by_email(self, Email: str) -> ClientRecord:
+        with self._lock:
+            ids = self._text_indexes['Email'].get(Email.lower())
+            return self._clients[min(ids)] if ids else None
+
+    @metrics.instrumented
+    def get_client_by_phone(self, PhoneNumber: str) -> ClientRecord:
+        with self._lock:
+            ClientID = self._by_phone.get(PhoneNumber)
+            return self._clients[ClientID] if ClientID is not None else None
+
+    @metrics.instrumented
+    def iter_clients(self, FirstName: str = None, LastName: str = None, Email: str = None,
+                     PhoneNumber: str = None, after_id: int = None, limit: int = None,
+                     itersize: int = 2000):
+        """
+        Ищет клиентов по заданным параметрам через индексы и отдает их в порядке ClientID.
+        Записи отдаются порциями по itersize; клиент, удаленный во время обхода, пропускается.
+
+        :return: Генератор ClientRecord.
+        """
+        with self._lock:
+            indexes = []
+            if PhoneNumber is not None:
+                ClientID = self._by_phone.get(PhoneNumber)
+                indexes.append((ClientID,) if ClientID is not None else ())
+            # Индексы по именам без учета регистра, точное совпадение проверяется по записи
+            criteria = {'FirstName': FirstName, 'LastName': LastName, 'Email': Email}
+            for field, value in criteria.items():
+                if value is not None:
+                    indexes.append(self._text_indexes[field].get(value.lower()))
+            # Пересечение начинается с самого избирательного условия
+            indexes.sort(key=len)
+            candidates = set(indexes[0]).intersection(*indexes[1:]) if indexes else None
+
+            if candidates is None:
+                start = bisect_right(self._order, after_id) if after_id is not None else 0
+                ids = self._order[start:start + limit if limit is not None else None]
+            else:
+                ids = sorted(ClientID for ClientID in candidates
+                             if (after_id is None or ClientID > after_id)
+                             and (FirstName is None or self._clients[ClientID].FirstName == FirstName)
+                             and (LastName is None or self._clients[ClientID].LastName == LastName))
+                ids = ids[:limit] if limit is not None else ids
+
+        for start in range(0, len(ids), itersize):
+            with self._lock:
+                chunk = [self._clients.get(ClientID) for ClientID in ids[start:start + itersize]]
+            for record in chunk:
+                if record is not None:
+                    yield record
+
+    def _ranked(self, matches: list, limit: int) -> list:
+        """
+        Как _SEARCH_RESULT в queries.py: клиент получает лучший ранг среди своих совпадений,
+        результат упорядочен по рангу и ClientID.
+
+        :param matches: Списки пар (ранг, ClientID), по одному на ветку поиска.
+        """
+        ranks = {}
+        for rank, ClientID in (match for branch in matches for match in branch):
+            if rank < ranks.get(ClientID, rank + 1):
+                ranks[ClientID] = rank
+        best = sorted((rank, ClientID) for ClientID, rank in ranks.items())[:limit]
+        return [self._clients[ClientID] for _, ClientID in best]
+
+    def _phone_rows(self, keys, limit: int) -> list:
+        # Строки ClientPhones по значениям PhoneDigits в порядке (PhoneDigits, ClientID), не больше limit
+        rows = []
+        for key in keys:
+            if len(rows) >= limit:
+                break
+            owners = (self._by_phone[PhoneNumber] for PhoneNumber in self._by_digits.get(key))
+            rows.extend(nsmallest(limit - len(rows), owners))
+        return list(enumerate(rows, 1))
+
+    @metrics.instrumented
+    def search_phones(self, PhoneNumber: str, mode: str = 'prefix', limit: int = 20) -> list:
+        """
+        Ищет клиентов по началу, концу или части номера телефона (см. StorageBackend.search_phones).
+        Начало и конец ищутся по отсортированным цифрам номеров, часть номера - просмотром всех номеров.
+
+        :return: Список ClientRecord.
+        """
+        if mode not in SEARCH_PHONE_MODES:
+            raise ValueError(f'mode должен быть одним из {SEARCH_PHONE_MODES}')
+        digits = phone_digits(PhoneNumber)
+        if not digits:
+            raise ValueError('Номер для поиска должен содержать цифры')
+        with self._lock:
+            if mode == 'prefix':
+                keys = self._by_digits.range(*prefix_bounds(digits))
+            elif mode == 'suffix':
+                keys = self._by_digits.range(*prefix_bounds(digits[::-1]), transform=_reverse)
+            else:
+                keys = sorted((key for key in self._by_digits.entries if digits in key),
+                              key=lambda key: (key.find(digits), len(key), key))
+            return self._ranked([self._phone_rows(keys, limit)], limit)
+
+    @metrics.instrumented
+    def search_clients(self, text: str, mode: str = 'prefix', fields: tuple = SEARCH_FIELDS,
+                       limit: int = 20) -> list:
+        """
+        Ищет клиентов по началу или похожести имени, фамилии и Email (см. StorageBackend.search_clients).
+        Похожесть считается по триграммам так же, как в pg_trgm.
+
+        :return: Список ClientRecord.
+        """
+        if mode not in SEARCH_CLIENT_MODES:
+            raise ValueError(f'mode должен быть одним из {SEARCH_CLIENT_MODES}')
+        fields = tuple(fields)
+        if not fields or not set(fields) <= set(SEARCH_FIELDS):
+            raise ValueError(f'fields должны быть из {SEARCH_FIELDS}')
+        if not text:
+            raise ValueError('Строка поиска не должна быть пустой')
+        text = text.lower()
+        with self._lock:
+            matches = []
+            for field in fields:
+                index = self._text_indexes[field]
+                if mode == 'prefix':
+                    rows = []
+                    for key in index.range(*prefix_bounds(text)):
+                        if len(rows) >= limit:
+                            break
+                        rows.extend(nsmallest(limit - len(rows), index.get(key)))
+                    matches.append(list(enumerate(rows, 1)))
+                else:
+                    matches.append(nsmallest(limit, ((1 - similarity, ClientID)
+                                                     for similarity, key in index.similar(text)
+                                                     for ClientID in index.get(key))))
+            return self._ranked(matches, limit)
+
+    @metrics.instrumented
+    def bulk_load(self, source, batch_size: int = 1000, on_conflict: str = 'skip') -> BulkLoadReport:
+        """
+        Загружает клиентов и их телефоны с той же политикой конфликтов, что и ClientRepository.bulk_load.
+        Каждая пачка применяется атомарно.
+        """
+        if on_conflict not in ON_CONFLICT_POLICIES:
+            raise ValueError(f'on_conflict должен быть одним из {ON_CONFLICT_POLICIES}')
+        if batch_size < 1:
+            raise ValueError('batch_size должен быть положительным')
+        if isinstance(source, (str, os.PathLike)):
+            source = read_client_records(source)
+
+        records = iter(source)
+        totals = [0, 0, 0, 0, 0]
+        started = time.perf_counter()
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            with self._transaction():
+                counts = self._load_batch(batch, on_conflict)
+            totals = [total + count for total, count in zip(totals, counts)]
+        return BulkLoadReport(*totals, time.perf_counter() - started)
+
+    def _load_batch(self, batch: list, on_conflict: str) -> tuple:
+        """
+        Применяет одну пачку записей в том же порядке, что и ClientRepository._load_batch:
+        сначала клиенты, затем телефоны, поэтому результат и ClientID совпадают с PostgreSQL.
+
+        :return: (records, clients, phones, rejected_clients, rejected_phones) для пачки.
+        """
+        clients = {}
+        rejected_clients = rejected_phones = 0
+        for record in batch:
+            FirstName, LastName, Email, phones = split_client_record(record)
+
+            if Email in clients:
+                if on_conflict == 'fail':
+                    raise psycopg2.errors.UniqueViolation(f'Email "{Email}" повторяется в загружаемых данных')
+                if on_conflict == 'skip':
+                    rejected_clients += 1
+                    rejected_phones += len(phones)
+                    continue
+                phones = clients[Email][2] + phones
+            clients[Email] = (FirstName, LastName, phones)
+
+        ids = {}
+        for Email, (FirstName, LastName, _) in clients.items():
+            ClientID = self._by_email.get(Email)
+            if ClientID is None:
+                ids[Email] = self.add_client(FirstName, LastName, Email)[0]
+                continue
+            # INSERT ... ON CONFLICT в PostgreSQL тоже расходует значение serial
+            self._next_id += 1
+            if on_conflict == 'fail':
+                self._check_email(Email)
+            elif on_conflict == 'upsert':
+                self.update_client_data(ClientID, FirstName, LastName)
+                ids[Email] = ClientID
+        rejected_clients += len(clients) - len(ids)
+
+        phones = {}
+        for Email, (_, _, numbers) in clients.items():
+            for PhoneNumber in numbers:
+                if Email not in ids or (on_conflict == 'skip' and PhoneNumber in phones):
+                    rejected_phones += 1
+                elif on_conflict == 'fail' and PhoneNumber in phones:
+                    raise psycopg2.errors.UniqueViolation(
+                        f'PhoneNumber "{PhoneNumber}" повторяется в загружаемых данных')
+                else:
+                    phones[PhoneNumber] = ids[Email]
+
+        inserted_phones = 0
+        for PhoneNumber, ClientID in phones.items():
+            owner = self._by_phone.get(PhoneNumber)
+            if owner is None:
+                self.add_phonenumber(ClientID, PhoneNumber)
+            elif on_conflict == 'skip':
+                continue
+            elif on_conflict == 'fail':
+                self._check_phone(PhoneNumber)
+            elif owner != ClientID:
+                self.delete_clientphone(owner, PhoneNumber)
+                self.add_phonenumber(ClientID, PhoneNumber)
+            inserted_phones += 1
+        rejected_phones += len(phones) - inserted_phones
+
+        return len(batch), len(ids), inserted_phones, rejected_clients, rejected_phones
+
+    @metrics.instrumented
+    def export_clients(self, path: str, fmt: str = None, rows_per_file: int = None, compress: bool = None,
+                       FirstName: str = None, LastName: str = None, Email: str = None, PhoneNumber: str = None,
+                       after_id: int = None, changed_since=None, itersize: int = 10000) -> ExportReport:
+        """
+        Выгружает клиентов с их телефонами порциями по itersize (см. StorageBackend.export_clients).
+        Клиент, измененный во время выгрузки, попадает в нее в новом виде и будет выгружен снова
+        при инкрементальной выгрузке от watermark.
+
+        :return: Итоговый отчет о выгрузке.
+        """
+        started = time.perf_counter()
+        watermark = datetime.now(timezone.utc)
+        now = watermark.timestamp()
+        since = changed_since.timestamp() if changed_since is not None else None
+        last_id = after_id
+        records = self.iter_clients(FirstName, LastName, Email, PhoneNumber, after_id, itersize=itersize)
+        with ExportWriter(path, fmt, rows_per_file, compress) as writer:
+            while True:
+                chunk = list(islice(records, itersize))
+                if not chunk:
+                    break
+                with self._lock:
+                    updated = [self._updated_at.get(record.ClientID, now) for record in chunk]
+                rows = [tuple(record) + (datetime.fromtimestamp(UpdatedAt, timezone.utc),)
+                        for record, UpdatedAt in zip(chunk, updated) if since is None or UpdatedAt >= since]
+                if rows:
+                    writer.write_rows(rows)
+                    last_id = rows[-1][0]
+        return ExportReport(writer.paths, writer.rows, last_id, watermark, time.perf_counter() - started)
+
+    @metrics.instrumented
+    def execute_batch(self, operations: list, page_size: int = 1000) -> list:
+        """
+        Выполняет операции по очереди и атомарно: при исключении откатываются все.
+        Как и в ClientRepository, операция над несуществующим клиентом или номером
+        не прерывает пакет, а возвращает ok=False. page_size не используется.
+
+        :return: Список OperationResult в порядке операций.
+        """
+        results = []
+        with self._transaction():
+            for operation, args in operations:
+                if operation == 'add_phonenumber' and args[0] not in self._clients:
+                    data = None
+                else:
+                    data = getattr(self, operation)(*args)
+                ok = bool(data)
+                results.append(OperationResult(operation, args, ok, data if isinstance(data, tuple) else None))
+        return results
+
+    @metrics.instrumented
+    def load_snapshot(self, records) -> int:
+        """
+        Заменяет содержимое хранилища снимком, сохраняя ClientID.
+        Например, для реплики чтения: backend.load_snapshot(ClientRepository(...).iter_clients()).
+
+        :param records: Итерируемый объект с ClientRecord.
+        :return: Количество загруженных клиентов.
+        """
+        with self._lock:
+            self.create_database()
+            for record in records:
+                self._replace(record.ClientID, ClientRecord(record.ClientID, record.FirstName, record.LastName,
+                                                            record.Email, tuple(record.PhoneNumbers)))
+                self._next_id = max(self._next_id, record.ClientID + 1)
+            return len(self._clients)
@@ -0,0 +1,474 @@
+"""
+Измерение операций хранилища: гистограммы времени, количество запросов и обращений к серверу,
+время получения соединения и выполнения запросов, прочитанные строки, ошибки по классам
+исключений и журнал медленных запросов. Снимок выгружается в JSON или текстовом формате Prometheus.
+
+Операции отмечаются декоратором instrumented, а драйверы сообщают о запросах через current_call().
+Пока у хранилища нет Instrumentation (или она выключена и не задан порог медленных запросов),
+декоратор сразу вызывает метод, а курсор и пул только проверяют current_call().
+"""
+from bisect import bisect_left
+from collections import namedtuple
+from contextvars import ContextVar
+from functools import wraps
+import inspect
+import json
+import logging
+import re
+import threading
+import time
+
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы в секундах
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class OperationEvent(namedtuple('OperationEvent', 'operation seconds queries round_trips rows '
+                                                  'connect_seconds execute_seconds error')):
+    """
+    Одна завершенная операция: имя метода хранилища, полное время, количество запросов
+    и обращений к серверу (запросы, выборки серверного курсора, BEGIN и COMMIT), количество строк,
+    время получения соединения и выполнения запросов, имя класса исключения или None.
+    """
+    __slots__ = ()
+
+
+class Call:
+    """
+    Счетчики выполняющейся операции. Драйверы получают объект через current_call()
+    и добавляют в него запросы, выборки и время получения соединения.
+    """
+    __slots__ = ('instrumentation', 'operation', 'queries', 'round_trips', 'rows',
+                 'connect_seconds', 'execute_seconds')
+
+    def __init__(self, instrumentation: 'Instrumentation', operation: str) -> None:
+        self.instrumentation = instrumentation
+        self.operation = operation
+        self.queries = 0
+        self.round_trips = 0
+        self.rows = 0
+        self.connect_seconds = 0.0
+        self.execute_seconds = 0.0
+
+    def add_query(self, sql, seconds: float, rows: int = 0) -> None:
+        """
+        Учитывает выполненный запрос: одно обращение к серверу.
+        """
+        self.queries += 1
+        self.round_trips += 1
+        self.rows += rows
+        self.execute_seconds += seconds
+        threshold = self.instrumentation.slow_query_threshold
+        if threshold is not None and seconds >= threshold:
+            self.instrumentation.log_slow_query(self.operation, sql, seconds)
+
+    def add_round_trip(self, seconds: float, rows: int = 0, count: int = 1) -> None:
+        """
+        Учитывает обращения к серверу, которые не являются отдельными запросами:
+        выборки серверного курсора, BEGIN и COMMIT.
+        """
+        self.round_trips += count
+        self.rows += rows
+        self.execute_seconds += seconds
+
+
+_current = ContextVar('metrics_call', default=None)
+
+
+def current_call() -> Call:
+    """
+    :return: Счетчики операции, выполняющейся в текущем потоке или задаче asyncio, или None.
+    """
+    return _current.get()
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин, как histogram в Prometheus.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценивает квантиль линейной интерполяцией внутри корзины.
+        Для последней корзины (больше самой большой границы) возвращается максимум.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.max
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = min(self.buckets[index], self.max)
+                return lower + (upper - lower) * max(rank - cumulative, 0) / count
+            cumulative += count
+        return self.max
+
+
+class _OperationStats:
+    __slots__ = ('histogram', 'errors', 'queries', 'round_trips', 'rows', 'connect_seconds', 'execute_seconds')
+
+    def __init__(self, buckets: tuple) -> None:
+        self.histogram = Histogram(buckets)
+        self.errors = {}
+        self.queries = 0
+        self.round_trips = 0
+        self.rows = 0
+        self.connect_seconds = 0.0
+        self.execute_seconds = 0.0
+
+
+class Instrumentation:
+    """
+    Собирает метрики операций хранилища. Передается хранилищу параметром instrumentation.
+
+        instrumentation = Instrumentation(slow_query_threshold=0.1)
+        repo = ClientRepository(instrumentation=instrumentation, database='clients', ...)
+        ...
+        print(instrumentation.to_prometheus())
+
+    Обработчики, добавленные через add_hook, получают OperationEvent после каждой операции.
+    Вложенные вызовы (например, find_client через iter_clients) учитываются в операции верхнего уровня.
+    """
+
+    def __init__(self, enabled: bool = True, slow_query_threshold: float = None,
+                 buckets: tuple = DEFAULT_BUCKETS) -> None:
+        """
+        :param enabled: Собирать ли метрики; можно менять на ходу.
+        :param slow_query_threshold: Запросы дольше стольких секунд пишутся в журнал
+                                     metrics с уровнем WARNING, в том числе при enabled=False.
+                                     None - не писать.
+        :param buckets: Границы корзин гистограммы времени операций в секундах.
+        """
+        self.enabled = enabled
+        self.slow_query_threshold = slow_query_threshold
+        self.buckets = tuple(buckets)
+        self._hooks = []
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, callback) -> None:
+        """
+        :param callback: Функция, которая получает OperationEvent после каждой операции.
+        """
+        self._hooks.append(callback)
+
+    def remove_hook(self, callback) -> None:
+        self._hooks.remove(callback)
+
+    def log_slow_query(self, operation: str, sql, seconds: float) -> None:
+        if isinstance(sql, bytes):
+            sql = sql.decode(errors='replace')
+        sql = re.sub(r'\s+', ' ', str(sql)).strip()
+        logger.warning('Медленный запрос в %s: %.3f с: %.500s', operation, seconds, sql)
+
+    def finish(self, call: Call, seconds: float, error: BaseException = None) -> None:
+        """
+        Записывает завершенную операцию и вызывает обработчики.
+        """
+        if not self.enabled:
+            return
+        error = type(error).__name__ if error is not None else None
+        with self._lock:
+            stats = self._operations.get(call.operation)
+            if stats is None:
+                stats = self._operations[call.operation] = _OperationStats(self.buckets)
+            stats.histogram.observe(seconds)
+            stats.queries += call.queries
+            stats.round_trips += call.round_trips
+            stats.rows += call.rows
+            stats.connect_seconds += call.connect_seconds
+            stats.execute_seconds += call.execute_seconds
+            if error is not None:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+
+        if self._hooks:
+            event = OperationEvent(call.operation, seconds, call.queries, call.round_trips, call.rows,
+                                   call.connect_seconds, call.execute_seconds, error)
+            for callback in list(self._hooks):
+                try:
+                    callback(event)
+                except Exception:
+                    logger.exception('Ошибка в обработчике метрик %r', callback)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations.clear()
+
+    def snapshot(self) -> dict:
+        """
+        :return: Метрики по операциям в виде словаря, пригодного для json.dumps.
+        """
+        with self._lock:
+            result = {}
+            for operation, stats in sorted(self._operations.items()):
+                histogram = stats.histogram
+                result[operation] = {
+                    'calls': histogram.count,
+                    'errors': dict(stats.errors),
+                    'seconds': histogram.sum,
+                    'max': histogram.max,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                    'queries': stats.queries,
+                    'round_trips': stats.round_trips,
+                    'rows': stats.rows,
+                    'connect_seconds': stats.connect_seconds,
+                    'execute_seconds': stats.execute_seconds,
+                    'buckets': dict(zip([str(bound) for bound in histogram.buckets] + ['+Inf'], histogram.counts)),
+                }
+            return result
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix: str = 'clients') -> str:
+        """
+        :return: Метрики в текстовом формате Prometheus.
+        """
+        snapshot = self.snapshot()
+        lines = [f'# HELP {prefix}_operation_duration_seconds Время выполнения операций хранилища.',
+                 f'# TYPE {prefix}_operation_duration_seconds histogram']
+        for operation, stats in snapshot.items():
+            cumulative = 0
+            for bound, count in stats['buckets'].items():
+                cumulative += count
+                lines.append(f'{prefix}_operation_duration_seconds_bucket'
+                             f'{{operation="{operation}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_operation_duration_seconds_sum{{operation="{operation}"}} {stats["seconds"]}')
+            lines.append(f'{prefix}_operation_duration_seconds_count{{operation="{operation}"}} {stats["calls"]}')
+
+        counters = (('queries', 'Выполненные запросы.'),
+                    ('round_trips', 'Обращения к серверу: запросы, выборки серверного курсора и COMMIT.'),
+                    ('rows', 'Строки, полученные от сервера.'),
+                    ('connect_seconds', 'Время получения соединения из пула.'),
+                    ('execute_seconds', 'Время выполнения запросов.'))
+        for name, description in counters:
+            lines.append(f'# HELP {prefix}_operation_{name}_total {description}')
+            lines.append(f'# TYPE {prefix}_operation_{name}_total counter')
+            for operation, stats in snapshot.items():
+                lines.append(f'{prefix}_operation_{name}_total{{operation="{operation}"}} {stats[name]}')
+
+        lines.append(f'# HELP {prefix}_operation_errors_total Ошибки операций по классам исключений.')
+        lines.append(f'# TYPE {prefix}_operation_errors_total counter')
+        for operation, stats in snapshot.items():
+            for error, count in sorted(stats['errors'].items()):
+                lines.append(f'{prefix}_operation_errors_total{{operation="{operation}",exception="{error}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _iterate(instrumentation: Instrumentation, call: Call, iterator):
+    # Время генератора - это время внутри next(), без времени обработки записей вызывающим кодом
+    seconds, error = 0.0, None
+    try:
+        while True:
+            token = _current.set(call)
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                seconds += time.perf_counter() - started
+                _current.reset(token)
+            yield item
+    finally:
+        token = _current.set(call)
+        try:
+            iterator.close()
+        finally:
+            _current.reset(token)
+            instrumentation.finish(call, seconds, error)
+
+
+async def _aiterate(instrumentation: Instrumentation, call: Call, iterator):
+    seconds, error = 0.0, None
+    try:
+        while True:
+            token = _current.set(call)
+            started = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                seconds += time.perf_counter() - started
+                _current.reset(token)
+            yield item
+    finally:
+        token = _current.set(call)
+        try:
+            await iterator.aclose()
+        finally:
+            _current.reset(token)
+            instrumentation.finish(call, seconds, error)
+
+
+def instrumented(method):
+    """
+    Декоратор метода хранилища: измеряет вызов, если у хранилища есть включенная
+    Instrumentation в атрибуте instrumentation. Поддерживает обычные и асинхронные методы и генераторы.
+    """
+    name = method.__name__
+
+    def _start(self):
+        instrumentation = self.instrumentation
+        if instrumentation is None or _current.get() is not None:
+            return None
+        # Без сбора метрик операцию все равно нужно отслеживать ради журнала медленных запросов
+        if not instrumentation.enabled and instrumentation.slow_query_threshold is None:
+            return None
+        return Call(instrumentation, name)
+
+    if inspect.isgeneratorfunction(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            call = _start(self)
+            if call is None:
+                return method(self, *args, **kwargs)
+            return _iterate(call.instrumentation, call, method(self, *args, **kwargs))
+
+    elif inspect.isasyncgenfunction(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            call = _start(self)
+            if call is None:
+                return method(self, *args, **kwargs)
+            return _aiterate(call.instrumentation, call, method(self, *args, **kwargs))
+
+    elif inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            call = _start(self)
+            if call is None:
+                return await method(self, *args, **kwargs)
+            token = _current.set(call)
+            started = time.perf_counter()
+            error = None
+            try:
+                return await method(self, *args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _current.reset(token)
+                call.instrumentation.finish(call, time.perf_counter() - started, error)
+
+    else:
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            call = _start(self)
+            if call is None:
+                return method(self, *args, **kwargs)
+            token = _current.set(call)
+            started = time.perf_counter()
+            error = None
+            try:
+                return method(self, *args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _current.reset(token)
+                call.instrumentation.finish(call, time.perf_counter() - started, error)
+
+    return wrapper
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """
+    Курсор psycopg2, который сообщает о запросах текущей операции (cursor_factory для psycopg2.connect).
+    У серверного курсора учитываются DECLARE и каждая выборка FETCH по itersize строк.
+    Вне autocommit учитывается и BEGIN, который psycopg2 отправляет перед первым запросом транзакции.
+    """
+
+    def _count_begin(self, call: Call) -> None:
+        conn = self.connection
+        if not conn.autocommit and conn.status == psycopg2.extensions.STATUS_READY:
+            call.add_round_trip(0.0)
+
+    def execute(self, query, vars=None):
+        call = _current.get()
+        if call is None:
+            return super().execute(query, vars)
+        self._count_begin(call)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            rows = self.rowcount if self.name is None and self.description is not None else 0
+            call.add_query(query, time.perf_counter() - started, max(rows, 0))
+
+    def copy_expert(self, sql, file, size=8192):
+        call = _current.get()
+        if call is None:
+            return super().copy_expert(sql, file, size)
+        self._count_begin(call)
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            call.add_query(sql, time.perf_counter() - started, max(self.rowcount, 0))
+
+    def fetchmany(self, size=None):
+        call = _current.get()
+        size = self.arraysize if size is None else size
+        if call is None or self.name is None:
+            return super().fetchmany(size)
+        # У серверного курсора каждый вызов - отдельный FETCH
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        call.add_round_trip(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __iter__(self):
+        call = _current.get()
+        if call is None or self.name is None:
+            return super().__iter__()
+        return self._iter_named(call)
+
+    def _iter_named(self, call: Call):
+        iterator = super().__iter__()
+        rows, seconds, exhausted = 0, 0.0, False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    return
+                finally:
+                    seconds += time.perf_counter() - started
+                rows += 1
+                yield row
+        finally:
+            # psycopg2 выбирает строки, пока FETCH не вернет пустой результат
+            fetches = -(-rows // self.itersize) + exhausted
+            call.add_round_trip(seconds, rows, fetches)
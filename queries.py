@@ -0,0 +1,464 @@
+"""
+SQL и типы результатов, общие для синхронного (homework.py) и асинхронного (homework_async.py) API.
+Оба драйвера (psycopg2 и psycopg 3) используют плейсхолдеры %s, поэтому тексты запросов одинаковы.
+"""
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+
+class ClientRecord(namedtuple('ClientRecord', 'ClientID FirstName LastName Email PhoneNumbers')):
+    """
+    Найденный клиент. PhoneNumbers - кортеж всех номеров клиента.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row) -> 'ClientRecord':
+        return cls(row[0], row[1], row[2], row[3], tuple(row[4]))
+
+
+DROP_TABLES = """
+DROP TABLE IF EXISTS ClientPhones;
+DROP TABLE IF EXISTS Clients;
+"""
+
+CREATE_CLIENTS = """
+CREATE TABLE IF NOT EXISTS Clients
+(
+    ClientID serial PRIMARY KEY,
+    FirstName varchar(50) NOT NULL,
+    LastName varchar(50) NOT NULL,
+    Email varchar(100) NOT NULL UNIQUE,
+    UpdatedAt timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+CREATE_CLIENT_PHONES = """
+CREATE TABLE IF NOT EXISTS ClientPhones
+(
+    PhoneID serial PRIMARY KEY,
+    ClientID integer REFERENCES Clients(ClientID),
+    PhoneNumber varchar(20) NOT NULL UNIQUE,
+    PhoneDigits varchar(20) COLLATE "C" NOT NULL
+        GENERATED ALWAYS AS (regexp_replace(PhoneNumber, '[^0-9]', '', 'g')) STORED
+);
+"""
+
+CREATE_INDEXES = """
+CREATE INDEX IF NOT EXISTS ClientPhones_ClientID_idx ON ClientPhones (ClientID);
+CREATE INDEX IF NOT EXISTS Clients_LastName_FirstName_idx ON Clients (LastName, FirstName);
+CREATE INDEX IF NOT EXISTS Clients_FirstName_idx ON Clients (FirstName);
+CREATE INDEX IF NOT EXISTS Clients_lower_Email_idx ON Clients (lower(Email));
+CREATE INDEX IF NOT EXISTS ClientPhones_PhoneDigits_idx ON ClientPhones (PhoneDigits, ClientID);
+CREATE INDEX IF NOT EXISTS ClientPhones_reverse_PhoneDigits_idx ON ClientPhones (reverse(PhoneDigits), ClientID);
+CREATE INDEX IF NOT EXISTS Clients_FirstName_prefix_idx ON Clients ((lower(FirstName) COLLATE "C"), ClientID);
+CREATE INDEX IF NOT EXISTS Clients_LastName_prefix_idx ON Clients ((lower(LastName) COLLATE "C"), ClientID);
+CREATE INDEX IF NOT EXISTS Clients_Email_prefix_idx ON Clients ((lower(Email) COLLATE "C"), ClientID);
+CREATE INDEX IF NOT EXISTS Clients_UpdatedAt_idx ON Clients (UpdatedAt);
+"""
+
+# Clients.UpdatedAt - время последнего изменения клиента или его телефонов, для инкрементальной выгрузки.
+# Триггеры на ClientPhones срабатывают один раз на команду и не трогают клиентов,
+# уже измененных в этой транзакции, поэтому массовая загрузка не делает лишних UPDATE
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION clients_touch() RETURNS trigger AS $$
+BEGIN
+    NEW.UpdatedAt := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION client_phones_touch() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE Clients SET UpdatedAt = now()
+        WHERE ClientID IN (SELECT ClientID FROM new_phones) AND UpdatedAt < now();
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE Clients SET UpdatedAt = now()
+        WHERE ClientID IN (SELECT ClientID FROM old_phones) AND UpdatedAt < now();
+    ELSE
+        -- ON CONFLICT DO UPDATE переписывает и неизменившиеся номера, такие клиенты не считаются измененными
+        UPDATE Clients SET UpdatedAt = now()
+        WHERE ClientID IN (SELECT unnest(ARRAY[O.ClientID, N.ClientID])
+                           FROM old_phones O JOIN new_phones N USING (PhoneID)
+                           WHERE (O.ClientID, O.PhoneNumber) IS DISTINCT FROM (N.ClientID, N.PhoneNumber))
+          AND UpdatedAt < now();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER Clients_touch_trg BEFORE UPDATE ON Clients
+FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION clients_touch();
+
+CREATE TRIGGER ClientPhones_insert_trg AFTER INSERT ON ClientPhones
+REFERENCING NEW TABLE AS new_phones
+FOR EACH STATEMENT EXECUTE FUNCTION client_phones_touch();
+
+CREATE TRIGGER ClientPhones_update_trg AFTER UPDATE ON ClientPhones
+REFERENCING OLD TABLE AS old_phones NEW TABLE AS new_phones
+FOR EACH STATEMENT EXECUTE FUNCTION client_phones_touch();
+
+CREATE TRIGGER ClientPhones_delete_trg AFTER DELETE ON ClientPhones
+REFERENCING OLD TABLE AS old_phones
+FOR EACH STATEMENT EXECUTE FUNCTION client_phones_touch();
+"""
+
+CREATE_DATABASE = (DROP_TABLES, CREATE_CLIENTS, CREATE_CLIENT_PHONES, CREATE_INDEXES, CREATE_TRIGGERS)
+
+# Триграммные индексы для поиска по подстроке номера и нечеткого поиска. Расширение pg_trgm
+# есть не на каждом сервере, поэтому они создаются отдельно и могут быть пропущены
+CREATE_TRIGRAM_INDEXES = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ClientPhones_PhoneDigits_trgm_idx ON ClientPhones USING gin (PhoneDigits gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS Clients_FirstName_trgm_idx ON Clients USING gist (lower(FirstName) gist_trgm_ops);
+CREATE INDEX IF NOT EXISTS Clients_LastName_trgm_idx ON Clients USING gist (lower(LastName) gist_trgm_ops);
+CREATE INDEX IF NOT EXISTS Clients_Email_trgm_idx ON Clients USING gist (lower(Email) gist_trgm_ops);
+"""
+
+# Изменяющие запросы возвращают через RETURNING все, что нужно вызывающему коду,
+# поэтому каждая операция укладывается в один запрос без предварительных SELECT
+ADD_CLIENT = """
+WITH C AS (
+    INSERT INTO Clients (FirstName, LastName, Email)
+    VALUES (%s, %s, %s)
+    RETURNING ClientID, FirstName, LastName, Email
+), P AS (
+    INSERT INTO ClientPhones (ClientID, PhoneNumber)
+    SELECT C.ClientID, V.PhoneNumber FROM C, (VALUES (%s::varchar)) AS V (PhoneNumber)
+    WHERE V.PhoneNumber IS NOT NULL
+    RETURNING PhoneNumber
+)
+SELECT C.ClientID, C.FirstName, C.LastName, C.Email, P.PhoneNumber FROM C LEFT JOIN P ON TRUE;
+"""
+
+ADD_PHONE = """
+WITH P AS (
+    INSERT INTO ClientPhones (ClientID, PhoneNumber)
+    VALUES (%s, %s)
+    RETURNING ClientID
+)
+SELECT C.FirstName, C.LastName, C.Email FROM P JOIN Clients C ON C.ClientID = P.ClientID;
+"""
+
+UPDATE_CLIENT = """
+UPDATE Clients
+SET FirstName=COALESCE(%s, FirstName),
+    LastName=COALESCE(%s, LastName),
+    Email=COALESCE(%s, Email)
+WHERE ClientID=%s
+RETURNING FirstName, LastName, Email;
+"""
+
+UPDATE_PHONE = """
+UPDATE ClientPhones
+SET PhoneNumber=COALESCE(%s, PhoneNumber)
+WHERE ClientID=%s AND PhoneNumber=%s
+RETURNING PhoneNumber;
+"""
+
+DELETE_PHONE = """
+DELETE FROM ClientPhones WHERE ClientID=%s AND PhoneNumber=%s
+RETURNING PhoneID;
+"""
+
+DELETE_CLIENT = """
+WITH P AS (
+    DELETE FROM ClientPhones WHERE ClientID=%s
+)
+DELETE FROM Clients WHERE ClientID=%s
+RETURNING ClientID;
+"""
+
+# Пакетные варианты тех же операций для psycopg2.extras.execute_values: VALUES %s
+# разворачивается в строки по шаблону, и вся группа одинаковых операций уходит одним запросом.
+# Строки для несуществующих клиентов и номеров просто не попадают в RETURNING
+BATCH_ADD_CLIENTS = """
+WITH V (FirstName, LastName, Email, PhoneNumber) AS (VALUES %s),
+C AS (
+    INSERT INTO Clients (FirstName, LastName, Email)
+    SELECT FirstName, LastName, Email FROM V
+    RETURNING ClientID, FirstName, LastName, Email
+), P AS (
+    INSERT INTO ClientPhones (ClientID, PhoneNumber)
+    SELECT C.ClientID, V.PhoneNumber FROM C JOIN V ON V.Email = C.Email
+    WHERE V.PhoneNumber IS NOT NULL
+    RETURNING ClientID, PhoneNumber
+)
+SELECT C.ClientID, C.FirstName, C.LastName, C.Email, P.PhoneNumber
+FROM C LEFT JOIN P ON P.ClientID = C.ClientID;
+"""
+BATCH_ADD_CLIENTS_TEMPLATE = '(%s::varchar, %s::varchar, %s::varchar, %s::varchar)'
+
+BATCH_ADD_PHONES = """
+WITH V (ClientID, PhoneNumber) AS (VALUES %s),
+P AS (
+    INSERT INTO ClientPhones (ClientID, PhoneNumber)
+    SELECT V.ClientID, V.PhoneNumber FROM V JOIN Clients C ON C.ClientID = V.ClientID
+    RETURNING ClientID, PhoneNumber
+)
+SELECT P.ClientID, P.PhoneNumber, C.FirstName, C.LastName, C.Email FROM P JOIN Clients C ON C.ClientID = P.ClientID;
+"""
+BATCH_ADD_PHONES_TEMPLATE = '(%s::integer, %s::varchar)'
+
+BATCH_UPDATE_CLIENTS = """
+UPDATE Clients C
+SET FirstName=COALESCE(V.FirstName, C.FirstName),
+    LastName=COALESCE(V.LastName, C.LastName),
+    Email=COALESCE(V.Email, C.Email)
+FROM (VALUES %s) AS V (ClientID, FirstName, LastName, Email)
+WHERE C.ClientID = V.ClientID
+RETURNING C.ClientID, C.FirstName, C.LastName, C.Email;
+"""
+BATCH_UPDATE_CLIENTS_TEMPLATE = '(%s::integer, %s::varchar, %s::varchar, %s::varchar)'
+
+BATCH_UPDATE_PHONES = """
+UPDATE ClientPhones CP
+SET PhoneNumber=COALESCE(V.NewPhone, CP.PhoneNumber)
+FROM (VALUES %s) AS V (ClientID, OldPhone, NewPhone)
+WHERE CP.ClientID = V.ClientID AND CP.PhoneNumber = V.OldPhone
+RETURNING CP.ClientID, V.OldPhone;
+"""
+BATCH_UPDATE_PHONES_TEMPLATE = '(%s::integer, %s::varchar, %s::varchar)'
+
+BATCH_DELETE_PHONES = """
+DELETE FROM ClientPhones CP
+USING (VALUES %s) AS V (ClientID, PhoneNumber)
+WHERE CP.ClientID = V.ClientID AND CP.PhoneNumber = V.PhoneNumber
+RETURNING CP.ClientID, CP.PhoneNumber;
+"""
+BATCH_DELETE_PHONES_TEMPLATE = '(%s::integer, %s::varchar)'
+
+BATCH_DELETE_CLIENTS = """
+WITH V (ClientID) AS (VALUES %s),
+P AS (
+    DELETE FROM ClientPhones WHERE ClientID IN (SELECT ClientID FROM V)
+)
+DELETE FROM Clients WHERE ClientID IN (SELECT ClientID FROM V)
+RETURNING ClientID;
+"""
+BATCH_DELETE_CLIENTS_TEMPLATE = '(%s::integer)'
+
+# Условия поиска клиента. Телефон сначала разрешается в ClientID по уникальному индексу,
+# поэтому в результат попадают все номера найденного клиента, а не только искомый
+FIND_CLIENT_PREDICATES = {
+    'ClientID': 'C.ClientID = %s',
+    'FirstName': 'C.FirstName = %s',
+    'LastName': 'C.LastName = %s',
+    'Email': 'lower(C.Email) = lower(%s)',
+    'PhoneNumber': 'C.ClientID = (SELECT ClientID FROM ClientPhones WHERE PhoneNumber = %s)',
+    'after_id': 'C.ClientID > %s',
+}
+
+
+CLIENT_COLUMNS = """
+    C.ClientID, C.FirstName, C.LastName, C.Email,
+    ARRAY(SELECT CP.PhoneNumber FROM ClientPhones CP
+          WHERE CP.ClientID = C.ClientID ORDER BY CP.PhoneID) AS PhoneNumbers
+"""
+
+
+@lru_cache(maxsize=None)
+def find_client_query(criteria: tuple, limit: bool = False) -> str:
+    """
+    Собирает запрос поиска клиента только из переданных условий.
+    Запрос кэшируется: для каждого набора условий текст строится один раз.
+
+    :param criteria: Имена заданных условий из FIND_CLIENT_PREDICATES в порядке параметров.
+    :param limit: Добавить LIMIT %s последним параметром.
+    """
+    where = ' AND '.join(FIND_CLIENT_PREDICATES[name] for name in criteria) or 'TRUE'
+    return f"""
+    SELECT {CLIENT_COLUMNS}
+    FROM Clients C
+    WHERE {where}
+    ORDER BY C.ClientID{' LIMIT %s' if limit else ''}
+    """
+
+
+def find_client_params(FirstName: str = None, LastName: str = None, Email: str = None,
+                       PhoneNumber: str = None, after_id: int = None, limit: int = None) -> tuple:
+    """
+    Готовит запрос поиска клиента и его параметры, отбрасывая незаданные условия.
+
+    :return: (sql, params).
+    """
+    criteria = {'FirstName': FirstName, 'LastName': LastName, 'Email': Email,
+                'PhoneNumber': PhoneNumber, 'after_id': after_id}
+    criteria = {k: v for k, v in criteria.items() if v is not None}
+    params = tuple(criteria.values()) + ((limit,) if limit is not None else ())
+    return find_client_query(tuple(criteria), limit is not None), params
+
+
+def phone_digits(PhoneNumber: str) -> str:
+    """
+    Приводит номер телефона к виду, в котором он хранится в ClientPhones.PhoneDigits: только цифры.
+    """
+    return re.sub('[^0-9]', '', PhoneNumber)
+
+
+def prefix_bounds(prefix: str) -> tuple:
+    """
+    Границы диапазона строк с заданным префиксом в порядке COLLATE "C": low <= value < high.
+    Диапазон, в отличие от LIKE, использует индекс и в подготовленных запросах.
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+SEARCH_PHONE_MODES = ('prefix', 'suffix', 'substring')
+SEARCH_CLIENT_MODES = ('prefix', 'fuzzy')
+SEARCH_FIELDS = ('FirstName', 'LastName', 'Email')
+
+# Условие поиска совпадений и порядок ранжирования для каждого вида поиска по номеру
+_PHONE_MATCHES = {
+    'prefix': ('CP.PhoneDigits >= %s AND CP.PhoneDigits < %s', 'CP.PhoneDigits'),
+    'suffix': ('reverse(CP.PhoneDigits) >= %s AND reverse(CP.PhoneDigits) < %s', 'reverse(CP.PhoneDigits)'),
+    'substring': ('CP.PhoneDigits LIKE %s', 'strpos(CP.PhoneDigits, %s), length(CP.PhoneDigits), CP.PhoneDigits'),
+}
+
+# Совпадения собираются отдельно по каждому полю с LIMIT, чтобы каждая ветка читала
+# начало своего индекса, а затем клиент получает лучший ранг среди своих совпадений
+_SEARCH_RESULT = """
+SELECT {columns}
+FROM (
+    SELECT ClientID, min(Rank) AS Rank FROM ({matches}) M GROUP BY ClientID
+) M JOIN Clients C ON C.ClientID = M.ClientID
+ORDER BY M.Rank, C.ClientID
+LIMIT %s
+"""
+
+
+@lru_cache(maxsize=None)
+def search_phones_query(mode: str) -> str:
+    where, order = _PHONE_MATCHES[mode]
+    matches = f"""
+    SELECT CP.ClientID, row_number() OVER (ORDER BY {order}, CP.ClientID) AS Rank
+    FROM ClientPhones CP WHERE {where}
+    ORDER BY {order}, CP.ClientID LIMIT %s
+    """
+    return _SEARCH_RESULT.format(columns=CLIENT_COLUMNS, matches=matches)
+
+
+def search_phones_params(PhoneNumber: str, mode: str = 'prefix', limit: int = 20) -> tuple:
+    """
+    Готовит запрос поиска клиентов по части номера телефона. В номере учитываются только цифры.
+
+    :return: (sql, params).
+    """
+    if mode not in SEARCH_PHONE_MODES:
+        raise ValueError(f'mode должен быть одним из {SEARCH_PHONE_MODES}')
+    digits = phone_digits(PhoneNumber)
+    if not digits:
+        raise ValueError('Номер для поиска должен содержать цифры')
+    if mode == 'prefix':
+        where, order = prefix_bounds(digits), ()
+    elif mode == 'suffix':
+        where, order = prefix_bounds(digits[::-1]), ()
+    else:
+        where, order = (f'%{digits}%',), (digits,)
+    return search_phones_query(mode), order + where + order + (limit, limit)
+
+
+@lru_cache(maxsize=None)
+def search_clients_query(mode: str, fields: tuple) -> str:
+    branches = []
+    for field in fields:
+        value = f'lower(C.{field})'
+        if mode == 'prefix':
+            value = f'({value} COLLATE "C")'
+            # Границы диапазона считаются сервером, чтобы lower() совпадал с индексом при любой локали
+            branches.append(f"""
+            (SELECT C.ClientID, row_number() OVER (ORDER BY {value}, C.ClientID) AS Rank
+             FROM Clients C
+             WHERE {value} >= (lower(%s) COLLATE "C")
+               AND {value} < ((left(lower(%s), -1) || chr(ascii(right(lower(%s), 1)) + 1)) COLLATE "C")
+             ORDER BY {value}, C.ClientID LIMIT %s)""")
+        else:
+            branches.append(f"""
+            (SELECT C.ClientID, {value} <-> lower(%s) AS Rank
+             FROM Clients C WHERE {value} %% lower(%s)
+             ORDER BY {value} <-> lower(%s), C.ClientID LIMIT %s)""")
+    return _SEARCH_RESULT.format(columns=CLIENT_COLUMNS, matches=' UNION ALL '.join(branches))
+
+
+def search_clients_params(text: str, mode: str = 'prefix', fields: tuple = SEARCH_FIELDS,
+                          limit: int = 20) -> tuple:
+    """
+    Готовит запрос поиска клиентов по началу (prefix) или по похожести (fuzzy, pg_trgm)
+    имени, фамилии и Email без учета регистра.
+
+    :return: (sql, params).
+    """
+    if mode not in SEARCH_CLIENT_MODES:
+        raise ValueError(f'mode должен быть одним из {SEARCH_CLIENT_MODES}')
+    fields = tuple(fields)
+    if not fields or not set(fields) <= set(SEARCH_FIELDS):
+        raise ValueError(f'fields должны быть из {SEARCH_FIELDS}')
+    if not text:
+        raise ValueError('Строка поиска не должна быть пустой')
+    params = (text, text, text, limit)
+    return search_clients_query(mode, fields), params * len(fields) + (limit,)
+
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = ('ClientID', 'FirstName', 'LastName', 'Email', 'PhoneNumbers', 'UpdatedAt')
+
+# Условия выгрузки: те же, что у поиска, плюс верхняя граница ClientID для выгрузки по частям
+# и время изменения для инкрементальной выгрузки
+EXPORT_PREDICATES = dict(FIND_CLIENT_PREDICATES, until_id='C.ClientID <= %s', changed_since='C.UpdatedAt >= %s')
+
+# Выгрузка идет в одном снимке данных, время его начала - отметка для следующей инкрементальной выгрузки
+EXPORT_SNAPSHOT = """
+SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;
+SELECT now();
+"""
+
+_PHONES_JSON = """(SELECT coalesce(json_agg(CP.PhoneNumber ORDER BY CP.PhoneID), '[]')
+     FROM ClientPhones CP WHERE CP.ClientID = C.ClientID)"""
+
+# CSV целиком формирует сервер через COPY, JSONL - json_build_object, поэтому клиенту
+# остается только записать готовые строки. Телефоны в CSV - JSON-массив в одном столбце
+_EXPORT_QUERIES = {
+    'csv': f"""
+    COPY (
+        SELECT C.ClientID, C.FirstName, C.LastName, C.Email, {_PHONES_JSON} AS PhoneNumbers,
+               btrim(to_json(C.UpdatedAt)::text, '"') AS UpdatedAt
+        FROM Clients C WHERE {{where}} ORDER BY C.ClientID
+    ) TO STDOUT WITH (FORMAT csv)
+    """,
+    'jsonl': f"""
+    SELECT C.ClientID, json_build_object(
+        'ClientID', C.ClientID, 'FirstName', C.FirstName, 'LastName', C.LastName, 'Email', C.Email,
+        'PhoneNumbers', {_PHONES_JSON}, 'UpdatedAt', C.UpdatedAt)::text
+    FROM Clients C WHERE {{where}} ORDER BY C.ClientID
+    """,
+    'last_id': 'SELECT max(C.ClientID) FROM Clients C WHERE {where}',
+    'boundary': 'SELECT C.ClientID FROM Clients C WHERE {where} ORDER BY C.ClientID OFFSET %s LIMIT 1',
+}
+
+
+@lru_cache(maxsize=None)
+def export_query(kind: str, criteria: tuple) -> str:
+    """
+    :param kind: 'csv' и 'jsonl' - сама выгрузка, 'last_id' - наибольший выгружаемый ClientID,
+                 'boundary' - ClientID, на котором заканчивается очередной файл (параметр OFFSET последним).
+    :param criteria: Имена заданных условий из EXPORT_PREDICATES в порядке параметров.
+    """
+    where = ' AND '.join(EXPORT_PREDICATES[name] for name in criteria) or 'TRUE'
+    return _EXPORT_QUERIES[kind].format(where=where)
+
+
+def export_params(kind: str, FirstName: str = None, LastName: str = None, Email: str = None,
+                  PhoneNumber: str = None, after_id: int = None, until_id: int = None,
+                  changed_since=None, offset: int = None) -> tuple:
+    """
+    Готовит запрос выгрузки клиентов и его параметры, отбрасывая незаданные условия.
+
+    :return: (sql, params).
+    """
+    criteria = {'FirstName': FirstName, 'LastName': LastName, 'Email': Email, 'PhoneNumber': PhoneNumber,
+                'after_id': after_id, 'until_id': until_id, 'changed_since': changed_since}
+    criteria = {k: v for k, v in criteria.items() if v is not None}
+    params = tuple(criteria.values()) + ((offset,) if kind == 'boundary' else ())
+    return export_query(kind, tuple(criteria)), params
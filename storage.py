@@ -0,0 +1,426 @@
+"""
+Общий интерфейс хранилища клиентов и типы, которые не зависят от конкретной реализации.
+Реализации: ClientRepository (PostgreSQL, homework.py) и MemoryBackend (memory_backend.py).
+"""
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from contextlib import contextmanager
+import csv
+import gzip
+import io
+from itertools import chain
+import json
+import os
+
+import metrics
+from queries import EXPORT_COLUMNS, EXPORT_FORMATS, SEARCH_FIELDS, ClientRecord
+
+ON_CONFLICT_POLICIES = ('skip', 'upsert', 'fail')
+
+
+class BulkLoadReport(namedtuple('BulkLoadReport', 'records clients phones rejected_clients rejected_phones seconds')):
+    """
+    Итог массовой загрузки: сколько записей прочитано, сколько клиентов и телефонов
+    записано в базу, сколько отклонено и сколько секунд заняла загрузка.
+    """
+    __slots__ = ()
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.records / self.seconds if self.seconds else 0.0
+
+
+class ExportReport(namedtuple('ExportReport', 'files rows last_id watermark seconds')):
+    """
+    Итог выгрузки: список записанных файлов, сколько клиентов выгружено, наибольший выгруженный ClientID,
+    отметка времени для следующей инкрементальной выгрузки (changed_since) и сколько секунд она заняла.
+    """
+    __slots__ = ()
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class OperationResult(namedtuple('OperationResult', 'operation args ok data')):
+    """
+    Результат одной операции пакета: имя операции, ее аргументы, признак того,
+    что операция что-то изменила, и возвращенные данные (как у одноименного метода хранилища).
+    """
+    __slots__ = ()
+
+
+class Batch:
+    """
+    Очередь изменяющих операций для StorageBackend.batch().
+    Методы повторяют одноименные методы хранилища, но только запоминают операцию.
+    После выхода из блока with результаты доступны в атрибуте results.
+    """
+
+    def __init__(self) -> None:
+        self.operations = []
+        self.results = None
+
+    def add_client(self, FirstName: str, LastName: str, Email: str, PhoneNumber: str = None) -> None:
+        self.operations.append(('add_client', (FirstName, LastName, Email, PhoneNumber)))
+
+    def add_phonenumber(self, ClientID: int, PhoneNumber: str) -> None:
+        self.operations.append(('add_phonenumber', (ClientID, PhoneNumber)))
+
+    def update_client_data(self, ClientID: int, FirstName: str = None, LastName: str = None,
+                           Email: str = None) -> None:
+        self.operations.append(('update_client_data', (ClientID, FirstName, LastName, Email)))
+
+    def update_phonenumber(self, ClientID: int, old_phone: str = None, new_phone: str = None) -> None:
+        self.operations.append(('update_phonenumber', (ClientID, old_phone, new_phone)))
+
+    def delete_clientphone(self, ClientID: int, PhoneNumber: str) -> None:
+        self.operations.append(('delete_clientphone', (ClientID, PhoneNumber)))
+
+    def delete_client(self, ClientID: int) -> None:
+        self.operations.append(('delete_client', (ClientID,)))
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+
+def _split_extension(path: str) -> tuple:
+    """
+    :return: (путь без расширений, расширение формата, признак сжатия .gz).
+    """
+    base, extension = os.path.splitext(os.fspath(path))
+    compressed = extension.lower() == '.gz'
+    if compressed:
+        base, extension = os.path.splitext(base)
+    return base, extension.lower(), compressed
+
+
+def read_client_records(path: str):
+    """
+    Построчно читает записи о клиентах из файла .csv или .jsonl, в том числе сжатого .gz.
+
+    В CSV каждая строка имеет вид FirstName,LastName,Email[,PhoneNumber...],
+    строка заголовка FirstName,LastName,Email пропускается. CSV, записанный export_clients
+    (первая строка - заголовок ClientID,FirstName,...), читается по именам столбцов.
+    В JSONL каждая строка - объект с ключами FirstName, LastName, Email и PhoneNumbers (список).
+
+    :param path: Путь к файлу.
+    :return: Генератор записей (FirstName, LastName, Email, [PhoneNumber, ...]).
+    """
+    _, extension, compressed = _split_extension(path)
+    opener = gzip.open if compressed else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as file:
+        if extension == '.csv':
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header and header[0] == 'ClientID':
+                for row in reader:
+                    record = dict(zip(header, row))
+                    yield (record['FirstName'], record['LastName'], record['Email'],
+                           json.loads(record['PhoneNumbers'] or '[]'))
+                return
+            for row in chain((header,), reader):
+                if not row or row[:3] == ['FirstName', 'LastName', 'Email']:
+                    continue
+                yield row[0], row[1], row[2], row[3:]
+        elif extension in ('.jsonl', '.ndjson'):
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield (record['FirstName'], record['LastName'], record['Email'],
+                           record.get('PhoneNumbers') or [])
+        else:
+            raise ValueError(f'Неподдерживаемый формат файла: "{extension}"')
+
+
+def split_client_record(record) -> tuple:
+    """
+    Приводит запись для массовой загрузки к виду (FirstName, LastName, Email, [PhoneNumber, ...]).
+    Телефоны могут быть заданы списком, одной строкой или отсутствовать; пустые номера отбрасываются.
+    """
+    FirstName, LastName, Email = record[:3]
+    phones = record[3] if len(record) > 3 and record[3] else []
+    phones = [phones] if isinstance(phones, str) else [phone for phone in phones if phone]
+    return FirstName, LastName, Email, phones
+
+
+class ExportWriter:
+    """
+    Записывает выгрузку клиентов в один файл или в серию файлов не больше rows_per_file строк:
+    clients.csv.gz -> clients-00001.csv.gz, clients-00002.csv.gz, ...
+    Каждый CSV-файл начинается с заголовка EXPORT_COLUMNS. Файлы открываются в двоичном режиме
+    с большим буфером, поэтому готовые строки от сервера пишутся без перекодирования.
+    """
+    # Уровень сжатия gzip: 9 (по умолчанию в gzip) в несколько раз медленнее при почти том же размере
+    compresslevel = 6
+    buffer_size = 1 << 20
+
+    def __init__(self, path: str, fmt: str = None, rows_per_file: int = None, compress: bool = None) -> None:
+        """
+        :param path: Путь к файлу выгрузки.
+        :param fmt: 'csv' или 'jsonl'; по умолчанию определяется по расширению path.
+        :param rows_per_file: Максимальное количество строк в одном файле; None - один файл.
+        :param compress: Сжимать gzip; по умолчанию - если path оканчивается на .gz.
+        """
+        base, extension, compressed = _split_extension(path)
+        fmt = fmt or {'.ndjson': 'jsonl'}.get(extension, extension.lstrip('.'))
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f'Неподдерживаемый формат выгрузки: "{fmt}"')
+        if rows_per_file is not None and rows_per_file < 1:
+            raise ValueError('rows_per_file должен быть положительным')
+        self.fmt = fmt
+        self.rows_per_file = rows_per_file
+        self.compress = compressed if compress is None else compress
+        self._base = base
+        self._extension = extension or f'.{fmt}'
+        self.paths = []
+        self.rows = 0
+        self._file = None
+        self._file_rows = 0
+
+    def next_file(self):
+        """
+        Закрывает текущий файл и открывает следующий.
+
+        :return: Двоичный файловый объект.
+        """
+        self._close_file()
+        number = f'-{len(self.paths) + 1:05d}' if self.rows_per_file else ''
+        path = f'{self._base}{number}{self._extension}{".gz" if self.compress else ""}'
+        if self.compress:
+            raw = gzip.open(path, 'wb', compresslevel=self.compresslevel)
+        else:
+            raw = open(path, 'wb')
+        self._file = io.BufferedWriter(raw, self.buffer_size)
+        self._file_rows = 0
+        self.paths.append(path)
+        if self.fmt == 'csv':
+            self._file.write((','.join(EXPORT_COLUMNS) + '\n').encode())
+        return self._file
+
+    def write_rows(self, rows: list) -> None:
+        """
+        Записывает строки выгрузки, при необходимости переходя к следующему файлу.
+
+        :param rows: Кортежи значений EXPORT_COLUMNS (PhoneNumbers - последовательность,
+                     UpdatedAt - datetime) или уже готовые строки JSONL.
+        """
+        while rows:
+            if self._file is None or (self.rows_per_file and self._file_rows >= self.rows_per_file):
+                self.next_file()
+            room = self.rows_per_file - self._file_rows if self.rows_per_file else len(rows)
+            part, rows = rows[:room], rows[room:]
+            self._file.write(self._encode(part))
+            self._file_rows += len(part)
+            self.rows += len(part)
+
+    def _encode(self, rows: list) -> bytes:
+        if self.fmt == 'jsonl':
+            lines = (row if isinstance(row, str) else
+                     json.dumps(dict(zip(EXPORT_COLUMNS, row[:4] + (list(row[4]), row[5].isoformat()))),
+                                ensure_ascii=False)
+                     for row in rows)
+            return ''.join(f'{line}\n' for line in lines).encode()
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(
+            row[:4] + (json.dumps(list(row[4]), ensure_ascii=False), row[5].isoformat()) for row in rows)
+        return buffer.getvalue().encode()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        # Пустая выгрузка - это один файл (для CSV - с заголовком), а не отсутствие файлов
+        if not self.paths:
+            self.next_file()
+        self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_file()
+
+
+class StorageBackend(ABC):
+    """
+    Хранилище клиентов и их телефонов с семантикой схемы из create_database:
+    Email и PhoneNumber уникальны, телефон принадлежит существующему клиенту.
+    Методы возвращают данные и пробрасывают исключения, ничего не печатая.
+    """
+    # Сбор метрик операций (metrics.Instrumentation); None - не собирать
+    instrumentation = None
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @abstractmethod
+    def create_database(self) -> None:
+        """
+        Создает пустое хранилище, удаляя существующие данные.
+        """
+
+    @abstractmethod
+    def add_client(self, FirstName: str, LastName: str, Email: str, PhoneNumber: str = None) -> tuple:
+        """
+        :return: (ClientID, FirstName, LastName, Email, PhoneNumber) добавленного клиента.
+        """
+
+    @abstractmethod
+    def add_phonenumber(self, ClientID: int, PhoneNumber: str) -> tuple:
+        """
+        :return: (FirstName, LastName, Email) клиента.
+        """
+
+    @abstractmethod
+    def update_client_data(self, ClientID: int, FirstName: str = None, LastName: str = None,
+                           Email: str = None) -> tuple:
+        """
+        :return: (FirstName, LastName, Email) после изменения или None, если клиента не существует.
+        """
+
+    @abstractmethod
+    def update_phonenumber(self, ClientID: int, old_phone: str = None, new_phone: str = None) -> bool:
+        """
+        :return: True, если у клиента был номер old_phone и он изменен.
+        """
+
+    @abstractmethod
+    def delete_clientphone(self, ClientID: int, PhoneNumber: str) -> bool:
+        """
+        :return: True, если номер был найден и удален.
+        """
+
+    @abstractmethod
+    def delete_client(self, ClientID: int) -> bool:
+        """
+        :return: True, если клиент существовал.
+        """
+
+    @abstractmethod
+    def get_client(self, ClientID: int) -> ClientRecord:
+        """
+        :return: ClientRecord или None, если клиента не существует.
+        """
+
+    @abstractmethod
+    def get_client_by_email(self, Email: str) -> ClientRecord:
+        """
+        :return: ClientRecord или None, если клиента с таким Email (без учета регистра) не существует.
+        """
+
+    @abstractmethod
+    def get_client_by_phone(self, PhoneNumber: str) -> ClientRecord:
+        """
+        :return: ClientRecord или None, если номер никому не принадлежит.
+        """
+
+    @abstractmethod
+    def iter_clients(self, FirstName: str = None, LastName: str = None, Email: str = None,
+                     PhoneNumber: str = None, after_id: int = None, limit: int = None,
+                     itersize: int = 2000):
+        """
+        :return: Генератор ClientRecord в порядке ClientID.
+        """
+
+    @metrics.instrumented
+    def find_client(self, FirstName: str = None, LastName: str = None, Email: str = None,
+                    PhoneNumber: str = None) -> list:
+        """
+        :return: Список ClientRecord.
+        """
+        return list(self.iter_clients(FirstName, LastName, Email, PhoneNumber))
+
+    @abstractmethod
+    def search_phones(self, PhoneNumber: str, mode: str = 'prefix', limit: int = 20) -> list:
+        """
+        Ищет клиентов по части номера телефона. В номере учитываются только цифры,
+        поэтому '+7-999-999-99-22', '79999999922' и '7 (999) 999-99-22' равнозначны.
+
+        :param PhoneNumber: Искомые цифры номера.
+        :param mode: 'prefix' - начало номера, 'suffix' - конец номера, 'substring' - любая часть.
+        :param limit: Максимальное количество клиентов.
+        :return: Список ClientRecord, лучшие совпадения первыми: точное совпадение, затем по порядку номеров.
+        """
+
+    @abstractmethod
+    def search_clients(self, text: str, mode: str = 'prefix', fields: tuple = SEARCH_FIELDS,
+                       limit: int = 20) -> list:
+        """
+        Ищет клиентов по имени, фамилии и Email без учета регистра.
+
+        :param text: Строка поиска.
+        :param mode: 'prefix' - поле начинается с text, 'fuzzy' - поле похоже на text
+                     (триграммное сходство, как в pg_trgm, не меньше 0.3).
+        :param fields: В каких полях искать.
+        :param limit: Максимальное количество клиентов.
+        :return: Список ClientRecord, лучшие совпадения первыми.
+        """
+
+    @abstractmethod
+    def bulk_load(self, source, batch_size: int = 1000, on_conflict: str = 'skip') -> BulkLoadReport:
+        """
+        :param source: Итерируемый объект с записями (FirstName, LastName, Email, [PhoneNumber, ...])
+                       или путь к файлу .csv / .jsonl (см. read_client_records).
+        :param batch_size: Количество записей в одной пачке.
+        :param on_conflict: 'skip', 'upsert' или 'fail' для уже существующих Email и PhoneNumber.
+        """
+
+    @abstractmethod
+    def export_clients(self, path: str, fmt: str = None, rows_per_file: int = None, compress: bool = None,
+                       FirstName: str = None, LastName: str = None, Email: str = None, PhoneNumber: str = None,
+                       after_id: int = None, changed_since=None, itersize: int = 10000) -> ExportReport:
+        """
+        Потоково выгружает клиентов с их телефонами в порядке ClientID (см. ExportWriter).
+        Расход памяти не зависит от объема выгрузки.
+
+        :param path: Путь к файлу .csv или .jsonl, с .gz - сжатый.
+        :param fmt: 'csv' или 'jsonl', если формат не следует из расширения.
+        :param rows_per_file: Делить выгрузку на файлы не больше чем по rows_per_file клиентов.
+        :param compress: Сжимать gzip независимо от расширения.
+        :param FirstName, LastName, Email, PhoneNumber: Условия отбора, как у iter_clients.
+        :param after_id: Выгрузить только клиентов с ClientID больше указанного.
+        :param changed_since: Выгрузить только клиентов, измененных (вместе с телефонами) не раньше
+                              этого времени (datetime), например watermark предыдущей выгрузки.
+                              Удаленные клиенты в инкрементальную выгрузку не попадают.
+        :param itersize: Сколько клиентов читать из хранилища за один раз.
+        :return: Итоговый отчет о выгрузке.
+        """
+
+    @abstractmethod
+    def execute_batch(self, operations: list, page_size: int = 1000) -> list:
+        """
+        Выполняет операции атомарно (см. batch()).
+
+        :param operations: Список пар (имя метода, кортеж аргументов).
+        :param page_size: Максимальное количество операций в одном обращении к хранилищу.
+        :return: Список OperationResult в порядке операций.
+        """
+
+    @contextmanager
+    def batch(self, page_size: int = 1000):
+        """
+        Собирает изменяющие операции и при выходе из блока with выполняет их атомарно.
+        Если хотя бы одна операция нарушает ограничения схемы, не применяется ни одна.
+
+            with repo.batch() as batch:
+                batch.add_client('Иван', 'Петров', 'ivan@mail.ru')
+                batch.update_phonenumber(1, '+7-999-999-99-11', '+7-999-999-91-11')
+            batch.results  # список OperationResult в порядке операций
+
+        :param page_size: Максимальное количество операций в одном обращении к хранилищу.
+        """
+        batch = Batch()
+        yield batch
+        batch.results = self.execute_batch(batch.operations, page_size)
@@ -0,0 +1,44 @@
+"""
+Деление операций ClientRepository.execute_batch на запросы.
+"""
+from homework import _group_operations
+
+
+def sizes(operations: list) -> list:
+    return [(operation, len(group)) for operation, group in _group_operations(operations)]
+
+
+def test_consecutive_operations_share_a_statement():
+    assert sizes([
+        ('add_client', ('Иван', 'Петров', 'ivan@mail.ru', None)),
+        ('add_client', ('Анна', 'Смирнова', 'anna@mail.ru', '+71')),
+        ('add_phonenumber', (1, '+72')),
+        ('add_phonenumber', (1, '+73')),
+        ('add_client', ('Петр', 'Иванов', 'petr@mail.ru', None)),
+    ]) == [('add_client', 2), ('add_phonenumber', 2), ('add_client', 1)]
+
+
+def test_repeated_key_starts_a_new_statement():
+    assert sizes([
+        ('update_client_data', (1, 'Иван', None, None)),
+        ('update_client_data', (2, 'Анна', None, None)),
+        ('update_client_data', (1, None, 'Петров', None)),
+        ('delete_client', (3,)),
+        ('delete_client', (3,)),
+    ]) == [('update_client_data', 2), ('update_client_data', 1), ('delete_client', 1), ('delete_client', 1)]
+
+
+def test_phone_moved_twice_starts_a_new_statement():
+    assert sizes([
+        ('update_phonenumber', (1, '+71', '+72')),
+        ('update_phonenumber', (2, '+73', '+74')),
+        ('update_phonenumber', (3, '+72', '+75')),
+    ]) == [('update_phonenumber', 2), ('update_phonenumber', 1)]
+
+
+def test_each_email_change_starts_a_new_statement():
+    assert sizes([
+        ('update_client_data', (1, None, None, 'new@mail.ru')),
+        ('update_client_data', (2, 'Анна', None, None)),
+        ('update_client_data', (3, None, None, 'old@mail.ru')),
+    ]) == [('update_client_data', 2), ('update_client_data', 1)]
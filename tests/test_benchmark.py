@@ -0,0 +1,92 @@
+"""
+Генерация данных и нагрузки бенчмарка, перцентили и сравнение с предыдущим запуском.
+"""
+import pytest
+
+import benchmark
+from memory_backend import MemoryBackend
+from metrics import Instrumentation
+
+
+def test_percentile_nearest_rank():
+    values = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+    assert benchmark.percentile(values, 0.5) == 5.0
+    assert benchmark.percentile(values, 0.95) == 10.0
+    assert benchmark.percentile(values, 0.0) == 1.0
+    assert benchmark.percentile([3.0], 0.99) == 3.0
+    assert benchmark.percentile([], 0.5) == 0.0
+
+
+def test_clients_are_deterministic():
+    assert benchmark.make_client(42) == benchmark.make_client(42)
+    assert benchmark.make_client(42) != benchmark.make_client(42, seed=1)
+    clients = list(benchmark.generate_clients(2000))
+    assert len({client.Email for client in clients}) == 2000
+    share = sum(not client.PhoneNumbers for client in clients) / len(clients)
+    assert share == pytest.approx(benchmark.PHONES_DISTRIBUTION[0], abs=0.03)
+
+
+def test_workload_targets_do_not_overlap():
+    iterations, levels = 5, 3
+    workload = benchmark.build_workload(1000, 7, iterations, levels)
+    assert workload == benchmark.build_workload(1000, 7, iterations, levels)
+    operations = {(operation, criterion): levels_args for operation, criterion, levels_args in workload}
+    assert set(criterion for operation, criterion in operations if operation == 'find_client') == \
+        set(benchmark.FIND_CRITERIA)
+    assert all(len(levels_args) == levels and all(len(args) == iterations for args in levels_args)
+               for levels_args in operations.values())
+
+    def targets(operation: str) -> list:
+        return [args[0] for level in operations[operation, None] for args in level]
+
+    changed, delete_phones = targets('delete_client'), targets('delete_clientphone')
+    assert len(set(changed)) == len(changed) == iterations * levels
+    assert not set(changed) & set(delete_phones)
+    assert targets('update_client_data') == targets('update_phonenumber') == changed
+    for ClientID, old_phone, _ in operations['update_phonenumber', None][0]:
+        assert old_phone in benchmark.make_client(ClientID, 7).PhoneNumbers
+    for FirstName, LastName, Email, PhoneNumber in operations['find_client', 'Email'][0]:
+        assert (FirstName, LastName, PhoneNumber) == (None, None, None) and Email.endswith(
+            benchmark.EMAIL_DOMAINS)
+
+
+def test_workload_needs_clients_with_phones():
+    with pytest.raises(ValueError):
+        benchmark.build_workload(50, 0, 10, 3)
+
+
+def test_run_benchmark_on_memory_backend():
+    repo = MemoryBackend(instrumentation=Instrumentation())
+    report = benchmark.run_benchmark(repo, (500,), (1, 2), iterations=5, warmup=2)
+    assert [dataset['size'] for dataset in report['datasets']] == [500]
+    assert len(report['results']) == 2 * (6 + len(benchmark.FIND_CRITERIA))
+    assert all(result['errors'] == {} and result['iterations'] == 5 for result in report['results'])
+    # Сколько клиентов добавлено на двух уровнях, столько же и удалено
+    assert len(repo) == 500
+
+
+def result(operation: str, p95_ms: float, throughput: float, criterion: str = None) -> dict:
+    return {'size': 10, 'operation': operation, 'criterion': criterion, 'concurrency': 1,
+            'p95_ms': p95_ms, 'throughput': throughput}
+
+
+def test_compare_reports_regressions_beyond_threshold():
+    baseline = [result('add_client', 1.0, 1000), result('find_client', 1.0, 1000, 'Email'),
+                result('delete_client', 0.0, 1000)]
+    current = [result('add_client', 1.05, 850), result('find_client', 1.5, 700, 'Email'),
+               result('delete_client', 0.5, 1000), result('add_phonenumber', 9.0, 1)]
+    assert benchmark.compare(current, baseline, 0.2) == [
+        '10 x1 find_client[Email]: p95 1.000 -> 1.500 мс',
+        '10 x1 find_client[Email]: 1000 -> 700 оп/с',
+    ]
+    assert benchmark.compare(current, baseline, 0.1) == [
+        '10 x1 add_client: 1000 -> 850 оп/с',
+        '10 x1 find_client[Email]: p95 1.000 -> 1.500 мс',
+        '10 x1 find_client[Email]: 1000 -> 700 оп/с',
+    ]
+
+
+def test_default_sizes_depend_on_backend():
+    assert benchmark.parse_args([]).sizes == (10_000, 1_000_000)
+    assert benchmark.parse_args(['--backend', 'postgres', '--ephemeral']).sizes[-1] == 10_000_000
+    assert benchmark.parse_args(['--sizes', '500']).sizes == [500]
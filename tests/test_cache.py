@@ -0,0 +1,89 @@
+"""
+ClientCache: поиск по ключам, вытеснение LRU, время жизни и метки поколений.
+"""
+from homework import ClientCache, ClientRepository
+from memory_backend import MemoryBackend
+from queries import ClientRecord
+
+
+def record(ClientID: int, Email: str, *PhoneNumbers: str) -> ClientRecord:
+    return ClientRecord(ClientID, 'Иван', 'Петров', Email, PhoneNumbers)
+
+
+def test_lookup_by_id_email_and_phone():
+    cache = ClientCache()
+    cache.put(record(1, 'Ivan@mail.ru', '+71', '+72'), cache.token(), ('Email', 'PhoneNumber'))
+    assert cache.get(('ClientID', 1)).ClientID == 1
+    assert cache.get(('Email', 'ivan@MAIL.ru')).ClientID == 1
+    assert cache.get(('PhoneNumber', '+72')).ClientID == 1
+    assert cache.get(('PhoneNumber', '+73')) is None
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 0, 'size': 1}
+
+
+def test_lru_eviction_drops_aliases():
+    cache = ClientCache(maxsize=2)
+    for ClientID in (1, 2):
+        cache.put(record(ClientID, f'{ClientID}@mail.ru', f'+7{ClientID}'), cache.token(), ('Email', 'PhoneNumber'))
+    cache.get(('ClientID', 1))
+    cache.put(record(3, '3@mail.ru'), cache.token())
+    assert cache.get(('PhoneNumber', '+72')) is None
+    assert cache.get(('Email', '1@mail.ru')).ClientID == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_expired_entries_are_not_returned():
+    cache = ClientCache(ttl=0)
+    cache.put(record(1, 'ivan@mail.ru'), cache.token())
+    assert cache.get(('ClientID', 1)) is None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size'] == 0
+
+
+def test_put_after_invalidation_is_ignored():
+    cache = ClientCache()
+    token = cache.token()
+    cache.invalidate(1)
+    cache.put(record(1, 'ivan@mail.ru'), token)
+    assert cache.get(('ClientID', 1)) is None
+
+
+def test_replaced_record_drops_old_aliases():
+    cache = ClientCache()
+    cache.put(record(1, 'ivan@mail.ru', '+71'), cache.token())
+    cache.put(record(1, 'ivan@mail.ru', '+72'), cache.token())
+    assert cache.get(('PhoneNumber', '+71')) is None
+    assert cache.get(('PhoneNumber', '+72')).PhoneNumbers == ('+72',)
+
+
+def test_invalidate_by_email_ignores_case():
+    cache = ClientCache()
+    cache.put(record(1, 'ivan@mail.ru'), cache.token(), ('Email',))
+    cache.put(record(2, 'anna@mail.ru'), cache.token(), ('Email',))
+    cache.invalidate(Emails=('IVAN@mail.ru',))
+    assert cache.get(('ClientID', 1)) is None
+    assert cache.get(('ClientID', 2)) is not None
+
+
+def test_email_alias_only_on_request():
+    cache = ClientCache()
+    cache.put(record(1, 'ivan@mail.ru', '+71'), cache.token())
+    assert cache.get(('PhoneNumber', '+71')).ClientID == 1
+    assert cache.get(('Email', 'ivan@mail.ru')) is None
+
+
+def test_email_lookup_is_not_served_from_records_read_by_id():
+    memory = MemoryBackend()
+    memory.add_client('Иван', 'Петров', 'Ivan@mail.ru')
+    memory.add_client('Иван', 'Петров', 'ivan@mail.ru')
+
+    def fetch(kind: str, value) -> list:
+        if kind == 'ClientID':
+            return [memory.get_client(value)]
+        return memory.find_client(**{kind: value})
+
+    repo = ClientRepository(pool=object(), cache=ClientCache())
+    repo._fetch_clients = fetch
+    repo.get_client(1)
+    repo.get_client(2)
+    assert [c.ClientID for c in repo.find_client(Email='ivan@mail.ru')] == [1, 2]
+    assert repo.get_client_by_email('ivan@mail.ru').ClientID == 1
@@ -0,0 +1,65 @@
+"""
+ExportWriter и read_client_records: выгруженные файлы читаются обратно без потерь.
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from memory_backend import MemoryBackend
+from storage import ExportWriter, read_client_records
+
+UPDATED_AT = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+ROWS = [(1, 'Иван', 'Петров', 'ivan@mail.ru', ('+71', '+72'), UPDATED_AT),
+        (2, 'Анна', 'Смирнова, "мл."', 'anna@mail.ru', (), UPDATED_AT),
+        (3, 'Петр', 'Иванов', 'petr@mail.ru', ('+73',), UPDATED_AT)]
+RECORDS = [(row[1], row[2], row[3], list(row[4])) for row in ROWS]
+
+
+@pytest.mark.parametrize('name', ['clients.csv', 'clients.jsonl', 'clients.csv.gz', 'clients.jsonl.gz'])
+def test_round_trip(tmp_path, name):
+    with ExportWriter(tmp_path / name) as writer:
+        writer.write_rows(ROWS)
+    assert writer.paths == [f'{tmp_path / name}']
+    assert list(read_client_records(writer.paths[0])) == RECORDS
+
+
+def test_split_into_numbered_files(tmp_path):
+    with ExportWriter(tmp_path / 'clients.csv.gz', rows_per_file=2) as writer:
+        writer.write_rows(ROWS[:1])
+        writer.write_rows(ROWS[1:])
+    assert [path.rsplit('/', 1)[1] for path in writer.paths] == ['clients-00001.csv.gz', 'clients-00002.csv.gz']
+    assert writer.rows == 3
+    assert [record for path in writer.paths for record in read_client_records(path)] == RECORDS
+
+
+def test_empty_export_writes_header(tmp_path):
+    with ExportWriter(tmp_path / 'clients.csv') as writer:
+        pass
+    assert (tmp_path / 'clients.csv').read_text().startswith('ClientID,FirstName')
+    assert list(read_client_records(writer.paths[0])) == []
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        ExportWriter(tmp_path / 'clients.xml')
+
+
+def test_backend_export_loads_back(tmp_path):
+    source = MemoryBackend()
+    source.bulk_load(RECORDS)
+    report = source.export_clients(tmp_path / 'clients.jsonl', after_id=1)
+    assert (report.rows, report.last_id) == (2, 3)
+
+    target = MemoryBackend()
+    target.bulk_load(report.files[0])
+    assert [record[1:] for record in target.iter_clients()] == [
+        ('Анна', 'Смирнова, "мл."', 'anna@mail.ru', ()), ('Петр', 'Иванов', 'petr@mail.ru', ('+73',))]
+
+
+def test_incremental_export(tmp_path):
+    backend = MemoryBackend()
+    backend.bulk_load(RECORDS)
+    watermark = backend.export_clients(tmp_path / 'full.csv').watermark
+    backend.update_client_data(2, LastName='Петрова')
+    report = backend.export_clients(tmp_path / 'changes.csv', changed_since=watermark)
+    assert [record[1] for record in read_client_records(report.files[0])] == ['Петрова']
@@ -0,0 +1,122 @@
+"""
+Ограничения схемы, атомарность пакетов и счетчики bulk_load в MemoryBackend.
+"""
+import psycopg2.errors
+import pytest
+
+from memory_backend import MemoryBackend
+
+
+@pytest.fixture
+def backend():
+    backend = MemoryBackend()
+    backend.add_client('Иван', 'Петров', 'ivan@mail.ru', '+71')
+    backend.add_client('Анна', 'Смирнова', 'anna@mail.ru')
+    return backend
+
+
+def test_unique_email_and_phone(backend):
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        backend.add_client('Петр', 'Иванов', 'ivan@mail.ru')
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        backend.add_phonenumber(2, '+71')
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        backend.update_client_data(2, Email='ivan@mail.ru')
+    assert backend.get_client(2).Email == 'anna@mail.ru'
+
+
+def test_foreign_key_not_null_and_length(backend):
+    with pytest.raises(psycopg2.errors.ForeignKeyViolation):
+        backend.add_phonenumber(99, '+79')
+    with pytest.raises(psycopg2.errors.NotNullViolation):
+        backend.add_client('Петр', None, 'petr@mail.ru')
+    with pytest.raises(psycopg2.errors.StringDataRightTruncation):
+        backend.add_client('Петр', 'Иванов', 'x' * 101)
+
+
+def test_failed_insert_consumes_client_id(backend):
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        backend.add_client('Петр', 'Иванов', 'ivan@mail.ru')
+    assert backend.add_client('Петр', 'Иванов', 'petr@mail.ru')[0] == 4
+
+
+def test_missing_rows_are_not_errors(backend):
+    assert backend.update_client_data(99, FirstName='Петр') is None
+    assert backend.update_phonenumber(1, '+79', '+72') is False
+    assert backend.delete_clientphone(2, '+71') is False
+    assert backend.delete_client(99) is False
+
+
+def test_find_client(backend):
+    backend.add_phonenumber(1, '+72')
+    assert [c.ClientID for c in backend.find_client(Email='IVAN@mail.ru')] == [1]
+    assert backend.find_client(PhoneNumber='+72')[0].PhoneNumbers == ('+71', '+72')
+    assert backend.find_client(FirstName='Анна', LastName='Петров') == []
+
+
+def test_batch_reports_missing_rows(backend):
+    with backend.batch() as batch:
+        batch.add_phonenumber(99, '+79')
+        batch.update_client_data(2, LastName='Петрова')
+        batch.delete_clientphone(1, '+79')
+    assert [result.ok for result in batch.results] == [False, True, False]
+    assert backend.get_client(2).LastName == 'Петрова'
+
+
+def test_batch_rolls_back_on_constraint_violation(backend):
+    before = list(backend.iter_clients())
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        with backend.batch() as batch:
+            batch.add_client('Петр', 'Иванов', 'petr@mail.ru', '+73')
+            batch.update_phonenumber(1, '+71', '+74')
+            batch.delete_client(2)
+            batch.add_phonenumber(1, '+73')
+    assert list(backend.iter_clients()) == before
+    assert backend.get_client_by_phone('+73') is None
+
+
+def test_bulk_load_skip_counts_in_batch_duplicates(backend):
+    report = backend.bulk_load([
+        ('Петр', 'Иванов', 'petr@mail.ru', ['+73', '+74']),
+        ('Петр', 'Иванов', 'petr@mail.ru', ['+75']),
+        ('Иван', 'Петров', 'ivan@mail.ru', ['+76']),
+        ('Олег', 'Сидоров', 'oleg@mail.ru', ['+71', '+77']),
+    ], on_conflict='skip')
+    assert report[:5] == (4, 2, 3, 2, 3)
+    assert backend.get_client_by_phone('+71').ClientID == 1
+    assert backend.get_client_by_phone('+75') is None
+
+
+def test_bulk_load_upsert_moves_phones(backend):
+    report = backend.bulk_load([
+        ('Иван', 'Иванов', 'ivan@mail.ru', []),
+        ('Анна', 'Смирнова', 'anna@mail.ru', ['+71']),
+    ], on_conflict='upsert')
+    assert report[:5] == (2, 2, 1, 0, 0)
+    assert backend.get_client(1) == (1, 'Иван', 'Иванов', 'ivan@mail.ru', ())
+    assert backend.get_client(2).PhoneNumbers == ('+71',)
+
+
+def test_bulk_load_fail_rolls_back_batch(backend):
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        backend.bulk_load([('Петр', 'Иванов', 'petr@mail.ru', ['+73']),
+                           ('Олег', 'Сидоров', 'oleg@mail.ru', ['+71'])], on_conflict='fail')
+    assert len(backend) == 2
+    assert backend.get_client_by_email('petr@mail.ru') is None
+
+
+def test_shared_index_keys(backend):
+    # Единственный клиент с данным значением хранится в индексе без отдельного множества
+    assert backend._text_indexes['Email'].entries['anna@mail.ru'] == 2
+    backend.add_client('Иван', 'Сидоров', 'IVAN@mail.ru', '+7 1')
+    backend.add_client('Иван', 'Кузнецов', 'Ivan@Mail.ru', '+7-1')
+    assert [c.ClientID for c in backend.find_client(Email='ivan@mail.ru')] == [1, 3, 4]
+    assert [c.ClientID for c in backend.search_phones('71')] == [1, 3, 4]
+    backend.delete_client(1)
+    backend.delete_client(4)
+    assert [c.ClientID for c in backend.find_client(Email='ivan@mail.ru')] == [3]
+    assert [c.ClientID for c in backend.find_client(FirstName='Иван')] == [3]
+    assert backend._text_indexes['Email'].entries['ivan@mail.ru'] == 3
+    backend.delete_client(3)
+    assert backend.find_client(Email='ivan@mail.ru') == []
+    assert 'ivan@mail.ru' not in backend._text_indexes['Email'].entries
@@ -0,0 +1,59 @@
+"""
+Гистограмма времени операций и сбор метрик операций хранилища.
+"""
+import logging
+
+import pytest
+
+import metrics
+from memory_backend import MemoryBackend
+from metrics import Histogram, Instrumentation
+
+
+def test_quantile_interpolates_within_bucket():
+    histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.25) == pytest.approx(1.0)
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(0.75) == pytest.approx(2.0)
+    assert histogram.quantile(1.0) == pytest.approx(3.0)
+
+
+def test_quantile_above_last_bucket_is_max():
+    histogram = Histogram(buckets=(1.0,))
+    histogram.observe(0.5)
+    histogram.observe(7.0)
+    assert histogram.quantile(0.99) == 7.0
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_operations_are_counted():
+    instrumentation = Instrumentation()
+    backend = MemoryBackend(instrumentation=instrumentation)
+    backend.add_client('Иван', 'Петров', 'ivan@mail.ru')
+    with pytest.raises(Exception):
+        backend.add_client('Иван', 'Петров', 'ivan@mail.ru')
+    backend.find_client(FirstName='Иван')
+    snapshot = instrumentation.snapshot()
+    assert snapshot['add_client']['calls'] == 2
+    assert snapshot['add_client']['errors'] == {'UniqueViolation': 1}
+    assert snapshot['find_client']['calls'] == 1
+    assert 'clients_operation_duration_seconds_count{operation="add_client"} 2' in instrumentation.to_prometheus()
+
+
+def test_slow_queries_are_logged_without_collection(caplog):
+    instrumentation = Instrumentation(enabled=False, slow_query_threshold=0.0)
+
+    class Store:
+        def __init__(self):
+            self.instrumentation = instrumentation
+
+        @metrics.instrumented
+        def find_client(self):
+            metrics.current_call().add_query('SELECT 1', 0.5)
+
+    with caplog.at_level(logging.WARNING, logger='metrics'):
+        Store().find_client()
+    assert 'SELECT 1' in caplog.text
+    assert instrumentation.snapshot() == {}
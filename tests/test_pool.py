@@ -0,0 +1,118 @@
+"""
+ConnectionPool: ограничение числа соединений, ожидание свободного, закрытие и транзакции.
+"""
+import threading
+
+import psycopg2
+import pytest
+from psycopg2.pool import PoolError
+
+import homework
+from homework import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.closed = 0
+        self.autocommit = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.log = []
+
+    def get_transaction_status(self) -> int:
+        return self.status
+
+    def commit(self) -> None:
+        self.log.append('commit')
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self) -> None:
+        self.log.append('rollback')
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self) -> None:
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**conn_params):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(homework.psycopg2, 'connect', connect)
+    return opened
+
+
+def test_min_size_connections_are_opened_in_autocommit(connections):
+    pool = ConnectionPool(min_size=2, max_size=3)
+    assert len(connections) == 2
+    assert all(conn.autocommit for conn in connections)
+    with pytest.raises(ValueError):
+        ConnectionPool(min_size=4, max_size=3)
+
+
+def test_checkout_limit_and_timeout(connections):
+    pool = ConnectionPool(min_size=0, max_size=2, timeout=0.01)
+    first, second = pool.getconn(), pool.getconn()
+    with pytest.raises(PoolError):
+        pool.getconn()
+    pool.putconn(first)
+    assert pool.getconn() is first
+    assert len(connections) == 2
+
+
+def test_waiting_thread_gets_returned_connection(connections):
+    pool = ConnectionPool(min_size=1, max_size=1, timeout=5)
+    conn = pool.getconn()
+    received = []
+    waiter = threading.Thread(target=lambda: received.append(pool.getconn()))
+    waiter.start()
+    pool.putconn(conn)
+    waiter.join(5)
+    assert received == [conn]
+
+
+def test_broken_and_unfinished_connections(connections):
+    pool = ConnectionPool(min_size=1, max_size=1)
+    conn = pool.getconn()
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.log == ['rollback']
+
+    conn.close()
+    replacement = pool.getconn()
+    assert replacement is not conn
+    pool.putconn(replacement, close=True)
+    assert replacement.closed
+    assert pool.getconn() is connections[-1]
+
+
+def test_close_closes_idle_now_and_busy_on_return(connections):
+    pool = ConnectionPool(min_size=2, max_size=2)
+    busy = pool.getconn()
+    pool.close()
+    idle = next(conn for conn in connections if conn is not busy)
+    assert idle.closed and not busy.closed
+    with pytest.raises(PoolError):
+        pool.getconn()
+    pool.putconn(busy)
+    assert busy.closed
+
+
+def test_transaction_commits_or_rolls_back(connections):
+    pool = ConnectionPool(min_size=1, max_size=1)
+    conn = connections[0]
+    with pool.transaction() as tx:
+        assert tx is conn and not conn.autocommit
+    assert conn.log == ['commit'] and conn.autocommit
+
+    with pytest.raises(RuntimeError):
+        with pool.transaction():
+            raise RuntimeError
+    assert conn.log == ['commit', 'rollback'] and conn.autocommit
+
+    with pool.connection() as conn:
+        assert conn.autocommit
+    assert conn.log == ['commit', 'rollback']
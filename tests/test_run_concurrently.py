@@ -0,0 +1,76 @@
+"""
+run_concurrently: порядок результатов, ограничение параллельности и обработка исключений.
+"""
+import asyncio
+import inspect
+
+import pytest
+
+from homework_async import run_concurrently
+
+
+class Tracker:
+    def __init__(self) -> None:
+        self.running = 0
+        self.peak = 0
+        self.started = 0
+        self.finished = 0
+
+    async def job(self, value, delay: float = 0.0):
+        self.started += 1
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(delay)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        finally:
+            self.running -= 1
+            self.finished += 1
+
+
+def test_results_keep_input_order():
+    tracker = Tracker()
+    jobs = [tracker.job(value, delay) for value, delay in ((1, 0.03), (2, 0.0), (3, 0.01))]
+    assert asyncio.run(run_concurrently(jobs, limit=3)) == [1, 2, 3]
+
+
+def test_limit_bounds_running_jobs_and_source_is_lazy():
+    tracker = Tracker()
+    seen = []
+
+    def jobs():
+        for value in range(10):
+            seen.append(tracker.finished)
+            yield tracker.job(value, 0.001)
+
+    assert asyncio.run(run_concurrently(jobs(), limit=3)) == list(range(10))
+    assert tracker.peak == 3
+    # Следующая операция берется из источника, только когда освобождается место
+    assert max(index - finished for index, finished in enumerate(seen)) <= 3
+    assert asyncio.run(run_concurrently([], limit=3)) == []
+
+
+def test_return_exceptions():
+    tracker = Tracker()
+    error = KeyError('x')
+    results = asyncio.run(run_concurrently([tracker.job(1), tracker.job(error), tracker.job(3)],
+                                           limit=2, return_exceptions=True))
+    assert results == [1, error, 3]
+
+
+def test_error_cancels_the_rest():
+    tracker = Tracker()
+    jobs = [tracker.job(ValueError('x'))] + [tracker.job(value, 0.01) for value in range(5)]
+    with pytest.raises(ValueError):
+        asyncio.run(run_concurrently(jobs, limit=2))
+    assert tracker.started < len(jobs)
+    assert tracker.running == 0
+    # Не начатые корутины закрываются, чтобы не было предупреждений о пропущенном await
+    assert all(inspect.getcoroutinestate(job) == inspect.CORO_CLOSED for job in jobs)
+
+
+def test_limit_must_be_positive():
+    with pytest.raises(ValueError):
+        asyncio.run(run_concurrently([], limit=0))
@@ -0,0 +1,84 @@
+"""
+Поиск по части номера и по началу или похожести имени в MemoryBackend.
+"""
+import pytest
+
+from memory_backend import MemoryBackend, trigrams
+
+
+@pytest.fixture
+def backend():
+    backend = MemoryBackend()
+    backend.add_client('Иван', 'Петров', 'ivan@mail.ru', '+7-999-123-45-67')
+    backend.add_client('Ивана', 'Смирнова', 'ivana@mail.ru', '8 (912) 345-67-89')
+    backend.add_client('Петр', 'Иванов', 'petr@mail.ru', '+7-999-000-11-22')
+    backend.add_phonenumber(3, '7 999 123 00 00')
+    return backend
+
+
+def ids(clients: list) -> list:
+    return [client.ClientID for client in clients]
+
+
+def test_search_phones_ignores_formatting(backend):
+    assert ids(backend.search_phones('+7 (999) 123')) == [3, 1]
+    assert ids(backend.search_phones('67-89', mode='suffix')) == [2]
+    assert ids(backend.search_phones('4567', mode='substring')) == [2, 1]
+    assert ids(backend.search_phones('999', mode='substring')) == [3, 1]
+    # Как и LIMIT в PostgreSQL, limit ограничивает совпавшие номера: оба первых номера у клиента 3
+    assert ids(backend.search_phones('7', limit=2)) == [3]
+    assert backend.search_phones('5', mode='prefix') == []
+
+
+def test_search_phones_rejects_bad_arguments(backend):
+    with pytest.raises(ValueError):
+        backend.search_phones('999', mode='infix')
+    with pytest.raises(ValueError):
+        backend.search_phones('+-()')
+
+
+def test_search_clients_by_prefix(backend):
+    assert ids(backend.search_clients('ИВАН')) == [1, 3, 2]
+    assert ids(backend.search_clients('иван', fields=('LastName',))) == [3]
+    assert ids(backend.search_clients('petr@')) == [3]
+    assert ids(backend.search_clients('п', fields=('FirstName', 'LastName'), limit=2)) == [1, 3]
+    with pytest.raises(ValueError):
+        backend.search_clients('иван', fields=('Phone',))
+    with pytest.raises(ValueError):
+        backend.search_clients('')
+
+
+def test_trigrams_match_pg_trgm():
+    assert trigrams('word') == {'  w', ' wo', 'wor', 'ord', 'rd '}
+    assert trigrams('Ab-c') == {'  a', ' ab', 'ab ', '  c', ' c '}
+
+
+def test_search_clients_fuzzy(backend):
+    assert ids(backend.search_clients('Смирнов', mode='fuzzy')) == [2]
+    assert ids(backend.search_clients('Ивано', mode='fuzzy', fields=('FirstName', 'LastName'))) == [3, 1, 2]
+    assert backend.search_clients('Сидоров', mode='fuzzy') == []
+
+
+def test_indexes_follow_writes(backend):
+    # Первые поиски строят отсортированные представления и триграммы
+    assert ids(backend.search_phones('912')) == []
+    assert ids(backend.search_phones('89', mode='suffix')) == [2]
+    assert ids(backend.search_clients('Козл', mode='fuzzy')) == []
+    assert ids(backend.search_clients('коз')) == []
+
+    backend.add_client('Олег', 'Козлов', 'oleg@mail.ru', '+7-912-000-00-89')
+    backend.update_phonenumber(2, '8 (912) 345-67-89', '+7-000')
+    backend.update_client_data(1, LastName='Козлович')
+    backend.delete_client(3)
+    assert ids(backend.search_phones('7912')) == [4]
+    assert ids(backend.search_phones('89', mode='suffix')) == [4]
+    assert ids(backend.search_phones('7999')) == [1]
+    assert ids(backend.search_clients('Козлов', mode='fuzzy')) == [4, 1]
+    assert ids(backend.search_clients('коз')) == [4, 1]
+    assert backend.search_clients('Иванов', mode='fuzzy', fields=('LastName',)) == []
+
+    # Много новых ключей вливаются в представление сортировкой, а не вставкой по одному
+    for number in range(40):
+        backend.add_client('Олег', f'Козлов{number:02}', f'oleg{number}@mail.ru', f'+7-912-111-11-{number:02}')
+    assert ids(backend.search_clients('козлов0', limit=3)) == [5, 6, 7]
+    assert ids(backend.search_phones('791211111', limit=100)) == list(range(5, 45))